@@ -0,0 +1,177 @@
+import json
+import random
+import time
+import numpy as np
+from script_to_upload_data import es, file_path, index_name, MAPEOS, read_mapping, bulk_load_parallel
+
+# Compara los perfiles de mapeo de script_to_upload_data cargando el mismo NDJSON en un
+# índice temporal por perfil y midiendo el tamaño en disco y la latencia de consultas.
+reporte_path = "reporte_mapeos.json"
+prefijo_indice = f"{index_name}_comparacion"  # Índices temporales: prefijo_perfil
+
+NUM_MUESTRAS = 20  # Documentos del archivo de los que se toman los valores consultados
+REPETICIONES = 10  # Veces que se ejecuta cada consulta de cada muestra
+RADIO_METROS = 200  # Radio de las consultas de cercanía a una puerta
+CONSERVAR_INDICES = False  # Si es True, los índices temporales no se borran al terminar
+
+def tomar_muestras(file_path, num_muestras=NUM_MUESTRAS, semilla=0):
+    """
+    Elige al azar (muestreo de reservorio, una sola pasada) documentos con housenumbers
+    y devuelve los valores con los que se arman las consultas.
+    """
+    aleatorio = random.Random(semilla)
+    elegidas = []
+    with open(file_path, "rb") as file:
+        for i, line in enumerate(file):
+            if i < num_muestras:
+                elegidas.append(line)
+            elif (j := aleatorio.randint(0, i)) < num_muestras:
+                elegidas[j] = line
+
+    muestras = []
+    for line in elegidas:
+        documento = json.loads(line)
+        casas = [c for c in documento.get("housenumbers") or [] if c.get("location")]
+        if not casas:
+            continue
+        ubicacion = aleatorio.choice(casas)["location"]
+        muestras.append({
+            "name": documento.get("name"),
+            "postcode": documento.get("postcode"),
+            "cod_district": documento.get("cod_district"),
+            "lon": float(ubicacion["lon"]),
+            "lat": float(ubicacion["lat"]),
+        })
+    return muestras
+
+def armar_consultas(perfil, muestra, radio_metros=RADIO_METROS):
+    """
+    Consultas equivalentes para cada perfil. En "estandar" los códigos se filtran por el
+    subcampo .keyword y la caja de cercanía con dos rangos float; en "geo" por el campo
+    keyword y con geo_bounding_box. geo_distance solo existe en el perfil "geo".
+
+    cod_district (del LEFT JOIN con los ubigeos), postcode y name pueden ser nulos y
+    Elasticsearch rechaza term y match con null: esas consultas se omiten en la muestra.
+    """
+    delta_lat = radio_metros / 111320
+    delta_lon = delta_lat / max(np.cos(np.radians(muestra["lat"])), 0.01)
+    sufijo = ".keyword" if perfil == "estandar" else ""
+    consultas = {}
+    if muestra["cod_district"] is not None:
+        consultas["distrito"] = {"term": {f"cod_district{sufijo}": muestra["cod_district"]}}
+    if muestra["postcode"] is not None:
+        consultas["postcode"] = {"term": {"postcode": muestra["postcode"]}}
+    if muestra["name"] is not None:
+        consultas["nombre"] = {"match": {"name": muestra["name"]}}
+    if perfil == "estandar":
+        caja = {"bool": {"filter": [
+            {"range": {"housenumbers.location.lat": {"gte": muestra["lat"] - delta_lat, "lte": muestra["lat"] + delta_lat}}},
+            {"range": {"housenumbers.location.lon": {"gte": muestra["lon"] - delta_lon, "lte": muestra["lon"] + delta_lon}}},
+        ]}}
+    else:
+        caja = {"geo_bounding_box": {"housenumbers.location": {
+            "top_left": {"lat": muestra["lat"] + delta_lat, "lon": muestra["lon"] - delta_lon},
+            "bottom_right": {"lat": muestra["lat"] - delta_lat, "lon": muestra["lon"] + delta_lon},
+        }}}
+        consultas["distancia"] = {"nested": {"path": "housenumbers", "query": {"geo_distance": {
+            "distance": f"{radio_metros}m", "housenumbers.location": {"lat": muestra["lat"], "lon": muestra["lon"]},
+        }}}}
+    consultas["caja"] = {"nested": {"path": "housenumbers", "query": caja}}
+    return consultas
+
+def cargar_perfil(es, indice, mapping, file_path):
+    """Crea el índice con el mapeo, carga el archivo y lo fusiona a un segmento para medirlo."""
+    if es.indices.exists(index=indice):
+        es.indices.delete(index=indice)
+    cuerpo = dict(mapping)
+    cuerpo["settings"] = {**mapping.get("settings", {}), "number_of_replicas": 0}
+    es.indices.create(index=indice, body=cuerpo)
+    bulk_load_parallel(es, indice, file_path, checkpoint_path=None, dead_letter_path=f"{file_path}.{indice}.rechazados.ndjson")
+    es.indices.refresh(index=indice)
+    es.options(request_timeout=3600).indices.forcemerge(index=indice, max_num_segments=1)
+    es.indices.refresh(index=indice)
+
+    primarios = es.indices.stats(index=indice, metric="store,docs")["indices"][indice]["primaries"]
+    return {"documentos": primarios["docs"]["count"], "tamano_bytes": primarios["store"]["size_in_bytes"]}
+
+def medir_consultas(es, indice, perfil, muestras, repeticiones=REPETICIONES):
+    """
+    Ejecuta cada tipo de consulta sobre todas las muestras (una pasada de calentamiento
+    y luego repeticiones) sin caché de peticiones. Devuelve, por tipo, la mediana y el
+    p95 del tiempo del servidor (took) y del cliente, en milisegundos.
+    """
+    tiempos = {}
+    for ronda in range(repeticiones + 1):
+        for muestra in muestras:
+            for tipo, consulta in armar_consultas(perfil, muestra).items():
+                inicio = time.perf_counter()
+                respuesta = es.search(index=indice, query=consulta, size=10, request_cache=False)
+                cliente = (time.perf_counter() - inicio) * 1000
+                if ronda == 0:
+                    continue  # Calentamiento
+                medidas = tiempos.setdefault(tipo, {"took": [], "cliente": [], "hits": []})
+                medidas["took"].append(respuesta["took"])
+                medidas["cliente"].append(cliente)
+                medidas["hits"].append(respuesta["hits"]["total"]["value"])
+
+    return {
+        tipo: {
+            "took_mediana_ms": float(np.median(medidas["took"])),
+            "took_p95_ms": float(np.percentile(medidas["took"], 95)),
+            "cliente_mediana_ms": float(np.median(medidas["cliente"])),
+            "cliente_p95_ms": float(np.percentile(medidas["cliente"], 95)),
+            "hits_promedio": float(np.mean(medidas["hits"])),
+            "ejecuciones": len(medidas["took"]),  # Menos que muestras * repeticiones si faltaba el valor
+        }
+        for tipo, medidas in tiempos.items()
+    }
+
+def comparar_mapeos(es, file_path, perfiles=MAPEOS, reporte_path=reporte_path):
+    """Carga el archivo con cada perfil, mide tamaño y latencia y guarda el reporte en JSON."""
+    muestras = tomar_muestras(file_path)
+    if not muestras:
+        raise ValueError(f"{file_path} no tiene documentos con housenumbers para armar las consultas")
+
+    reporte = {"archivo": file_path, "muestras": len(muestras), "repeticiones": REPETICIONES, "perfiles": {}}
+    indices = []
+    try:
+        for perfil, ruta_mapeo in perfiles.items():
+            indice = f"{prefijo_indice}_{perfil}"
+            indices.append(indice)
+            print(f"Cargando el perfil {perfil} ({ruta_mapeo}) en {indice}...")
+            resultado = {"mapeo": ruta_mapeo, **cargar_perfil(es, indice, read_mapping(ruta_mapeo), file_path)}
+            resultado["consultas"] = medir_consultas(es, indice, perfil, muestras)
+            reporte["perfiles"][perfil] = resultado
+    finally:
+        if not CONSERVAR_INDICES:
+            for indice in indices:
+                es.indices.delete(index=indice, ignore_unavailable=True)
+
+    with open(reporte_path, "w", encoding="utf-8") as f:
+        json.dump(reporte, f, ensure_ascii=False, indent=2)
+    return reporte
+
+def imprimir_reporte(reporte):
+    """Muestra el tamaño de cada índice y la latencia de cada consulta por perfil."""
+    perfiles = reporte["perfiles"]
+    base = next(iter(perfiles.values()))["tamano_bytes"]
+    print(f"\nArchivo: {reporte['archivo']}")
+    for perfil, resultado in perfiles.items():
+        variacion = (resultado["tamano_bytes"] / base - 1) * 100 if base else 0
+        print(f"{perfil:<10} {resultado['documentos']:>10} docs  {resultado['tamano_bytes'] / 1024 ** 2:>10.2f} MB  ({variacion:+.1f}%)")
+
+    tipos = sorted({tipo for resultado in perfiles.values() for tipo in resultado["consultas"]})
+    print(f"\n{'consulta':<10} {'perfil':<10} {'took p50':>9} {'took p95':>9} {'cliente p50':>12} {'hits':>8}")
+    for tipo in tipos:
+        for perfil, resultado in perfiles.items():
+            medidas = resultado["consultas"].get(tipo)
+            if medidas is None:
+                print(f"{tipo:<10} {perfil:<10} {'no soportada':>9}")
+                continue
+            print(f"{tipo:<10} {perfil:<10} {medidas['took_mediana_ms']:>9.1f} {medidas['took_p95_ms']:>9.1f} "
+                  f"{medidas['cliente_mediana_ms']:>12.1f} {medidas['hits_promedio']:>8.1f}")
+
+if __name__ == "__main__":
+    reporte = comparar_mapeos(es, file_path)
+    imprimir_reporte(reporte)
+    print(f"\nReporte guardado en {reporte_path}")
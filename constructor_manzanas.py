@@ -0,0 +1,157 @@
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from tqdm import tqdm  # Barra de progreso
+import ubigeo
+
+# Columnas que se agregan desde la tabla de ubigeos
+COLUMNAS_UBIGEO = ["cod_departament", "cod_province", "cod_district"]
+
+def agregar_ubigeo(df, postcodes):
+    """
+    Agrega las columnas cod_departament, cod_province y cod_district con una búsqueda
+    vectorizada en la tabla de ubigeos (sin apply por fila).
+
+    Args:
+        df (pd.DataFrame): Registros de lotes.
+        postcodes (pd.Series | np.ndarray): Postcode de cada fila, alineado con df; se
+            normaliza a entero, así que da igual si viene como número o texto.
+
+    Returns:
+        pd.DataFrame: Copia de df con las columnas de ubigeo; None si el postcode no existe.
+    """
+    return df.assign(**ubigeo.buscar(postcodes, COLUMNAS_UBIGEO))
+
+def _valores_python(serie):
+    """Arreglo object con los valores de la serie como escalares de Python (como iterrows)."""
+    valores = np.empty(len(serie), dtype=object)
+    valores[:] = serie.tolist()
+    return valores
+
+def id_padre(id_via, postcode, context, name):
+    """
+    Clave común de las partes de un documento dividido: el mismo sha1 que generar_id
+    (script_to_upload_data) le da al documento sin dividir.
+    """
+    partes = [id_via, postcode, context] + ([name] if id_via is None else [])
+    clave = "|".join("" if parte is None else str(parte) for parte in partes)
+    return hashlib.sha1(clave.encode("utf-8")).hexdigest()
+
+def orden_por_numero(numeros):
+    """
+    Claves para ordenar números de puerta por rango: la parte numérica inicial ("12-A" -> 12)
+    y luego el texto; los números sin parte numérica van al final.
+    """
+    textos = pd.Series(numeros, dtype=object).astype(str)
+    valores = pd.to_numeric(textos.str.extract(r"^\s*(\d+)", expand=False), errors="coerce")
+    return valores.fillna(np.inf).to_numpy(), textos.to_numpy()
+
+def construir_documentos(df, col_urb, col_manzana, col_lote, col_postcode, col_id=None,
+                         max_casas=None, ordenar_por_numero=False):
+    """
+    Agrupa los lotes por urbanización y manzana y genera un documento por grupo con
+    la lista anidada de housenumbers.
+
+    La agrupación se resuelve en bloque: se numeran los grupos con groupby, se ordenan
+    las filas una sola vez y cada grupo es un tramo contiguo (offsets) de las columnas
+    lote, lon y lat. El orden de los grupos, el de las casas dentro de cada grupo y los
+    tipos de cada valor son los mismos que con groupby + iterrows.
+
+    Args:
+        df (pd.DataFrame): Registros con lon, lat y las columnas de COLUMNAS_UBIGEO.
+        col_urb (str): Columna con el nombre de la urbanización.
+        col_manzana (str): Columna con el nombre de la manzana.
+        col_lote (str): Columna con el número de lote.
+        col_postcode (str): Columna con el postcode.
+        col_id (str | None): Columna con el id de la urbanización; si es None, id_via es None.
+        max_casas (int | None): Máximo de housenumbers por documento. Los grupos más grandes
+            se dividen en varios documentos con parent_id común (ver id_padre) y part/parts;
+            con None se genera un único documento por grupo, sin esos campos.
+        ordenar_por_numero (bool): Ordenar las casas de cada grupo por número (ver
+            orden_por_numero), así cada parte cubre un rango de números.
+
+    Yields:
+        dict: Documento de la manzana, listo para serializar.
+    """
+    claves = [col_urb, col_manzana] + ([col_id] if col_id else []) + [col_postcode] + COLUMNAS_UBIGEO
+
+    # groupby descarta las filas con alguna clave nula
+    df = df.dropna(subset=claves)
+    if df.empty:
+        return
+
+    agrupado = df.groupby(claves, sort=True)
+    grupo = agrupado.ngroup().to_numpy()
+    indice_grupos = agrupado.size().index
+
+    # Filas ordenadas por grupo, conservando el orden original (o por número) dentro de cada grupo
+    if ordenar_por_numero:
+        valor_numero, texto_numero = orden_por_numero(df[col_lote])
+        orden = np.lexsort((texto_numero, valor_numero, grupo))
+    else:
+        orden = np.argsort(grupo, kind="stable")
+    cortes = np.concatenate([[0], np.cumsum(np.bincount(grupo, minlength=len(indice_grupos)))])
+
+    # Valores de las casas con los mismos tipos que entrega iterrows (escalares de Python)
+    numeros = _valores_python(df[col_lote])[orden]
+    lons = _valores_python(df["lon"])[orden]
+    lats = _valores_python(df["lat"])[orden]
+
+    # Valores de las claves con los mismos tipos que entrega la iteración del groupby
+    valores_claves = {
+        clave: indice_grupos.levels[i].to_numpy()[indice_grupos.codes[i]]
+        for i, clave in enumerate(claves)
+    }
+
+    for g in range(len(indice_grupos)):
+        inicio, fin = cortes[g], cortes[g + 1]
+        if col_id:
+            id_urb = valores_claves[col_id][g]
+            id_via = int(id_urb) if str(id_urb).isdigit() else None
+        else:
+            id_via = None
+        documento = {
+            "id_via": id_via,
+            "name": valores_claves[col_urb][g],
+            "postcode": valores_claves[col_postcode][g],
+            "cod_departament": valores_claves["cod_departament"][g],
+            "cod_province": valores_claves["cod_province"][g],
+            "cod_district": valores_claves["cod_district"][g],
+            "context": valores_claves[col_manzana][g],
+            "type": "street",
+        }
+        if max_casas is None:
+            yield {
+                **documento,
+                "housenumbers": [
+                    {"number": numero, "location": {"lon": lon, "lat": lat}}
+                    for numero, lon, lat in zip(numeros[inicio:fin], lons[inicio:fin], lats[inicio:fin])
+                ],
+            }
+            continue
+
+        # Un documento por cada tramo de hasta max_casas casas, con la misma clave padre
+        padre = id_padre(id_via, documento["postcode"], documento["context"], documento["name"])
+        partes = range(inicio, fin, max_casas)
+        for parte, desde in enumerate(partes, start=1):
+            hasta = min(desde + max_casas, fin)
+            yield {
+                **documento,
+                "parent_id": padre,
+                "part": parte,
+                "parts": len(partes),
+                "housenumbers": [
+                    {"number": numero, "location": {"lon": lon, "lat": lat}}
+                    for numero, lon, lat in zip(numeros[desde:hasta], lons[desde:hasta], lats[desde:hasta])
+                ],
+            }
+
+def escribir_ndjson(documentos, output_file):
+    """Guarda los documentos en NDJSON, uno por línea, y devuelve cuántos escribió."""
+    total = 0
+    with open(output_file, "w", encoding="utf-8") as file:
+        for data in tqdm(documentos, desc="Escribiendo archivo"):
+            file.write(json.dumps(data, ensure_ascii=False, default=str) + "\n")
+            total += 1
+    return total
@@ -1,6 +1,37 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 import geopandas as gpd
-from shapely.geometry import Point
+import shapely
+from openpyxl import load_workbook
+from escritor_geoparquet import EscritorGeoParquet, FILAS_POR_GRUPO, LIMITES_PERU, escribir_geoparquet
+
+# Modo de lectura:
+# - "completo": carga la hoja entera con pandas.
+# - "streaming": lee las filas con openpyxl en modo solo lectura, por bloques (memoria acotada).
+#   Las columnas que no son coordenadas se guardan como texto y los encabezados repetidos o
+#   vacíos se nombran NOMBRE_2 y columna_6 (en "completo" quedan NOMBRE.1 y Unnamed: 5).
+MODO = "completo"
+TAMANO_BLOQUE = FILAS_POR_GRUPO  # Filas de Excel por bloque; cada bloque es un row group
+NUM_PROCESOS = os.cpu_count()  # Procesos para leer varias hojas en paralelo
+HOJAS = None  # Modo streaming: None (solo la primera hoja), "todas" o una lista de nombres
+
+def limpiar_coordenadas(valores):
+    """
+    Convierte una columna de coordenadas a float64. Los números se toman tal cual y solo
+    los textos que no se pueden convertir directamente se limpian (espacios, \\xa0);
+    lo que no es un número queda como NaN.
+    """
+    serie = pd.Series(valores, dtype=object)
+    numeros = pd.to_numeric(serie, errors="coerce")
+    pendientes = numeros.isna() & serie.notna()
+    if pendientes.any():
+        textos = serie[pendientes].astype(str).str.replace('\xa0', '').str.strip()
+        numeros[pendientes] = pd.to_numeric(textos, errors="coerce")
+    return numeros.to_numpy(dtype=np.float64)
 
 def xlsx_to_geoparquet(input_file: str, output_file: str, x_col: str, y_col: str, crs: str = "EPSG:4326"):
     """
@@ -18,29 +49,162 @@ def xlsx_to_geoparquet(input_file: str, output_file: str, x_col: str, y_col: str
 
     # Convertir todos los nombres de las columnas a cadenas de texto
     df.columns = df.columns.map(str)
-    
+
     # Verificar que las columnas de coordenadas existan
     if x_col not in df.columns or y_col not in df.columns:
         raise ValueError(f"El archivo XLSX debe contener las columnas '{x_col}' y '{y_col}'.")
 
     # Limpiar las columnas de coordenadas
-    df[x_col] = pd.to_numeric(df[x_col].astype(str).str.replace('\xa0', '').str.strip(), errors='coerce')
-    df[y_col] = pd.to_numeric(df[y_col].astype(str).str.replace('\xa0', '').str.strip(), errors='coerce')
+    df[x_col] = limpiar_coordenadas(df[x_col])
+    df[y_col] = limpiar_coordenadas(df[y_col])
 
     # Filtrar filas con valores nulos o faltantes en las columnas de coordenadas
     df = df.dropna(subset=[x_col, y_col])
 
-    # Crear geometrías de puntos solo para filas con datos válidos
-    geometry = [Point(xy) for xy in zip(df[x_col], df[y_col])]
-    
+    # Crear las geometrías de puntos en bloque
+    geometry = gpd.points_from_xy(df[x_col], df[y_col])
+
     # Convertir a GeoDataFrame
     gdf = gpd.GeoDataFrame(df, geometry=geometry, crs=crs)
-    
-    # Guardar en formato GeoParquet
-    gdf.to_parquet(output_file, engine='pyarrow')
+
+    # Guardar en formato GeoParquet (ordenado por Hilbert y con columna bbox)
+    escribir_geoparquet(gdf, output_file)
     print(f"Archivo GeoParquet creado exitosamente en: {output_file}")
 
-# Ejemplo de uso
-input_file = "municipalidad_casas.xlsx"  # Ruta al archivo XLSX de entrada
-output_file = "municipalidad_casas.parquet"  # Ruta al archivo GeoParquet de salida
-xlsx_to_geoparquet(input_file, output_file, x_col="LONGITUD", y_col="LATITUD")
+def nombres_de_columnas(encabezado):
+    """
+    Nombres de las columnas a partir de la fila de encabezado. Las celdas vacías se
+    llaman columna_<n> (posición desde 1) y los nombres repetidos reciben _2, _3, ...,
+    así ninguna columna de la hoja se pierde al armar el bloque.
+    """
+    bases = [
+        f"columna_{posicion}" if valor is None or str(valor).strip() == "" else str(valor)
+        for posicion, valor in enumerate(encabezado, start=1)
+    ]
+    # Los sufijos no pueden chocar con un nombre que ya trae la hoja más adelante
+    reservados = set(bases)
+    nombres = []
+    usados = set()
+    for base in bases:
+        nombre, repeticion = base, 1
+        while nombre in usados or (nombre != base and nombre in reservados):
+            repeticion += 1
+            nombre = f"{base}_{repeticion}"
+        usados.add(nombre)
+        nombres.append(nombre)
+    return nombres
+
+def leer_hoja_por_bloques(input_file, hoja, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Lee una hoja con openpyxl en modo solo lectura, sin cargarla completa.
+
+    La primera fila es el encabezado (ver nombres_de_columnas). Los atributos se
+    devuelven como texto: el tipo de una columna de Excel no se conoce hasta leer toda
+    la hoja y todos los bloques deben tener el mismo esquema. Una hoja con encabezado
+    y sin filas devuelve un bloque vacío; una hoja sin encabezado, ninguno.
+
+    Yields:
+        tuple: (nombres de las columnas, lista de columnas del bloque con los valores de las celdas).
+    """
+    libro = load_workbook(input_file, read_only=True, data_only=True)
+    try:
+        filas = libro[hoja].iter_rows(values_only=True)
+        encabezado = next(filas, None)
+        if encabezado is None:
+            return
+        columnas = nombres_de_columnas(encabezado)
+        bloques = 0
+        while True:
+            bloque = list(islice(filas, tamano_bloque))
+            if not bloque:
+                break
+            # Las filas cortas (celdas vacías al final) se completan con None
+            ancho = len(columnas)
+            filas_completas = (fila[:ancho] + (None,) * (ancho - len(fila)) for fila in bloque)
+            yield columnas, [list(valores) for valores in zip(*filas_completas)]
+            bloques += 1
+        if not bloques:
+            yield columnas, [[] for _ in columnas]
+    finally:
+        libro.close()
+
+def hoja_a_geoparquet(input_file, hoja, output_file, x_col, y_col, crs="EPSG:4326", tamano_bloque=TAMANO_BLOQUE):
+    """
+    Convierte una hoja en un GeoParquet escribiendo cada bloque de filas como un row group
+    (ordenado por Hilbert dentro del bloque). Si la hoja tiene encabezado pero ningún
+    punto válido, el archivo se crea vacío con el esquema de la hoja.
+
+    Returns:
+        int | None: Puntos escritos, o None si la hoja no tiene encabezado y no se creó archivo.
+    """
+    leida = False
+    escritor = EscritorGeoParquet(
+        output_file, crs=crs, tipos_geometria=["Point"], limites=LIMITES_PERU if crs == "EPSG:4326" else None,
+        filas_por_grupo=tamano_bloque
+    )
+    with escritor:
+        for columnas, valores in leer_hoja_por_bloques(input_file, hoja, tamano_bloque):
+            leida = True
+            if x_col not in columnas or y_col not in columnas:
+                raise ValueError(f"La hoja '{hoja}' debe contener las columnas '{x_col}' y '{y_col}'.")
+            datos = dict(zip(columnas, valores))
+            x = limpiar_coordenadas(datos[x_col])
+            y = limpiar_coordenadas(datos[y_col])
+            validas = ~(np.isnan(x) | np.isnan(y))
+            filas = np.flatnonzero(validas)
+
+            # Coordenadas como float64 y el resto como texto, en el orden de la hoja
+            tabla = pa.table({
+                columna: pa.array(x[validas]) if columna == x_col
+                else pa.array(y[validas]) if columna == y_col
+                else pa.array([None if v is None else str(v) for v in valores_columna], pa.string()).take(filas)
+                for columna, valores_columna in datos.items()
+            })
+            escritor.escribir(tabla, shapely.points(x[validas], y[validas]))
+    return escritor.filas if leida else None
+
+def xlsx_to_geoparquet_streaming(input_file: str, output_file: str, x_col: str, y_col: str, crs: str = "EPSG:4326",
+                                 hojas=None, num_procesos=NUM_PROCESOS):
+    """
+    Convierte un archivo XLSX en GeoParquet leyendo por bloques con memoria acotada.
+
+    Args:
+        input_file, output_file, x_col, y_col, crs: Igual que en xlsx_to_geoparquet.
+        hojas (list | str | None): Hojas a convertir. None convierte solo la primera (como
+            xlsx_to_geoparquet) en output_file; "todas" o una lista convierten cada hoja en
+            paralelo a su propio archivo (output_<hoja>.parquet).
+        num_procesos (int): Procesos para leer las hojas en paralelo.
+
+    Returns:
+        dict: Archivo de salida -> puntos escritos (None si la hoja estaba vacía y se omitió).
+    """
+    libro = load_workbook(input_file, read_only=True)
+    nombres = libro.sheetnames
+    libro.close()
+
+    if hojas is None:
+        hojas, salidas = nombres[:1], [output_file]
+        resultados = {output_file: hoja_a_geoparquet(input_file, nombres[0], output_file, x_col, y_col, crs)}
+    else:
+        hojas = nombres if hojas == "todas" else list(hojas)
+        base, extension = os.path.splitext(output_file)
+        salidas = [f"{base}_{hoja}{extension}" for hoja in hojas]
+        with ProcessPoolExecutor(max_workers=max(1, min(num_procesos, len(hojas)))) as pool:
+            resultados = dict(zip(salidas, pool.map(
+                hoja_a_geoparquet, repeat(input_file), hojas, salidas, repeat(x_col), repeat(y_col), repeat(crs)
+            )))
+    for hoja, salida in zip(hojas, salidas):
+        if resultados[salida] is None:
+            print(f"⚠️ La hoja '{hoja}' está vacía: se omitió y no se creó {salida}")
+        else:
+            print(f"Archivo GeoParquet creado exitosamente en: {salida} ({resultados[salida]} puntos)")
+    return resultados
+
+if __name__ == "__main__":
+    # Ejemplo de uso
+    input_file = "municipalidad_casas.xlsx"  # Ruta al archivo XLSX de entrada
+    output_file = "municipalidad_casas.parquet"  # Ruta al archivo GeoParquet de salida
+    if MODO == "streaming":
+        xlsx_to_geoparquet_streaming(input_file, output_file, x_col="LONGITUD", y_col="LATITUD", hojas=HOJAS)
+    else:
+        xlsx_to_geoparquet(input_file, output_file, x_col="LONGITUD", y_col="LATITUD")
@@ -1,41 +1,106 @@
-import json
-import pandas as pd
+import io
+import os
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.json as pj
 import geopandas as gpd
-from shapely.geometry import Point
+import shapely
 from tqdm import tqdm
-# Cargar archivo NDJSON
+from escritor_geoparquet import EscritorGeoParquet, FILAS_POR_GRUPO, LIMITES_PERU
+
+# Archivo NDJSON de entrada y nombre de los archivos de salida
 ndjson_file = "ndjson/calles.ndjson"  # Reemplaza con tu archivo
-output_name_file ="calles"
-# Leer el NDJSON línea por línea
-data = []
-with open(ndjson_file, "r", encoding="utf-8") as f:
-    for line in f:
-        data.append(json.loads(line))
-
-# Extraer puntos de housenumbers
-rows = []
-for entry in tqdm(data, desc="Extrayendo puntos"):
-    for house in entry.get("housenumbers", []):
-        rows.append({
-            "id_via": entry.get("id_via"),
-            "name": entry.get("name"),
-            "postcode": entry.get("postcode"),
-            "cod_departament": entry.get("cod_departament"),
-            "cod_province": entry.get("cod_province"),
-            "cod_district": entry.get("cod_district"),
-            "context": entry.get("context"),
-            "type": entry.get("type"),
-            "number": house["number"],
-            "geometry": Point(house["location"]["lon"], house["location"]["lat"])
-        })
-
-# Convertir a GeoDataFrame
-gdf = gpd.GeoDataFrame(rows, geometry="geometry", crs="EPSG:4326")
-
-# Guardar como Parquet
-# gdf.to_parquet("output.parquet", index=False)
-
-# Guardar como GPKG
-gdf.to_file(f"manzanas_con_geometria/{output_name_file}.gpkg", driver="GPKG")
-
-print(f"Conversión completada. Archivos generados: {output_name_file}.gpkg")
+output_name_file = "calles"
+output_dir = "manzanas_con_geometria"
+
+TAMANO_BLOQUE = 64 * 1024 * 1024  # Bytes de NDJSON que se parsean juntos
+ESCRIBIR_GPKG = False  # Además del GeoParquet, escribir un GPKG (más lento de escribir y consultar)
+
+# Orden de las filas dentro de cada bloque ("hilbert" o None)
+ORDEN = "hilbert"
+LIMITES_HILBERT = LIMITES_PERU  # La misma curva para todos los bloques
+
+# Atributos del documento que se copian a cada punto
+COLUMNAS = ["id_via", "name", "postcode", "cod_departament", "cod_province", "cod_district", "context", "type"]
+# Tipo de las columnas que vienen vacías en todo un bloque (el resto queda como texto)
+TIPOS_POR_DEFECTO = {"id_via": pa.int64()}
+
+def leer_bloques(ndjson_file, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Lee el NDJSON por bloques de líneas completas de alrededor de tamano_bloque bytes
+    y parsea cada bloque con pyarrow.json.
+
+    Yields:
+        tuple: (pa.Table del bloque, bytes leídos).
+    """
+    with open(ndjson_file, "rb") as f:
+        while True:
+            lineas = f.readlines(tamano_bloque)
+            if not lineas:
+                break
+            yield pj.read_json(io.BytesIO(b"".join(lineas))), sum(map(len, lineas))
+
+def aplanar_bloque(tabla):
+    """
+    Genera una fila por housenumber con los atributos de su documento, su número y su punto.
+
+    Returns:
+        tuple: (pa.Table con COLUMNAS y number, arreglo de puntos shapely),
+        o None si el bloque no tiene housenumbers.
+    """
+    casas = tabla["housenumbers"]
+    padres = pc.list_parent_indices(casas)
+    if len(padres) == 0:
+        return None
+    valores = pc.list_flatten(casas)
+
+    columnas = {}
+    for columna in COLUMNAS:
+        if columna in tabla.column_names:
+            valores_columna = tabla[columna].take(padres)
+        else:
+            valores_columna = pa.nulls(len(padres))
+        if pa.types.is_null(valores_columna.type):
+            valores_columna = valores_columna.cast(TIPOS_POR_DEFECTO.get(columna, pa.string()))
+        columnas[columna] = valores_columna
+    columnas["number"] = pc.struct_field(valores, "number").cast(pa.string())
+
+    lon = pc.struct_field(valores, ["location", "lon"]).cast(pa.float64()).to_numpy()
+    lat = pc.struct_field(valores, ["location", "lat"]).cast(pa.float64()).to_numpy()
+    return pa.table(columnas), shapely.points(lon, lat)
+
+def convertir(ndjson_file, parquet_path, gpkg_path=None):
+    """
+    Convierte el NDJSON en un GeoParquet de puntos escribiendo bloque a bloque, sin cargar
+    todo el archivo en memoria. Si se indica gpkg_path, también agrega cada bloque a un GPKG.
+    """
+    total = 0
+    escritor = EscritorGeoParquet(
+        parquet_path, tipos_geometria=["Point"], orden=ORDEN, limites=LIMITES_HILBERT,
+        filas_por_grupo=FILAS_POR_GRUPO
+    )
+    with escritor, tqdm(total=os.path.getsize(ndjson_file), unit="B", unit_scale=True, desc="Convirtiendo") as barra:
+        for tabla, leidos in leer_bloques(ndjson_file):
+            barra.update(leidos)
+            bloque = aplanar_bloque(tabla)
+            if bloque is None:
+                continue
+            tabla_puntos, puntos = bloque
+            escritor.escribir(tabla_puntos, puntos)
+
+            if gpkg_path:
+                gpd.GeoDataFrame(
+                    tabla_puntos.to_pandas(), geometry=puntos, crs="EPSG:4326"
+                ).to_file(gpkg_path, driver="GPKG", mode="w" if total == 0 else "a")
+            total += tabla_puntos.num_rows
+    return total
+
+if __name__ == "__main__":
+    os.makedirs(output_dir, exist_ok=True)
+    parquet_path = os.path.join(output_dir, f"{output_name_file}.parquet")
+    gpkg_path = os.path.join(output_dir, f"{output_name_file}.gpkg") if ESCRIBIR_GPKG else None
+
+    total = convertir(ndjson_file, parquet_path, gpkg_path)
+
+    archivos = [parquet_path] + ([gpkg_path] if gpkg_path else [])
+    print(f"Conversión completada: {total} puntos. Archivos generados: {', '.join(archivos)}")
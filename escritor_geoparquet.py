@@ -0,0 +1,240 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import geopandas as gpd
+import shapely
+from pyproj import CRS
+from tqdm import tqdm  # Barra de progreso
+
+# Filas por row group: grupos más chicos permiten saltar más datos en consultas por bbox
+FILAS_POR_GRUPO = 100000
+
+# Columna bbox (covering de GeoParquet 1.1) que usan DuckDB/pyarrow para filtrar row groups
+COLUMNA_BBOX = "bbox"
+CAMPOS_BBOX = ["xmin", "ymin", "xmax", "ymax"]
+
+# Envolvente del Perú en EPSG:4326, para usar la misma curva de Hilbert en todos los bloques
+LIMITES_PERU = (-81.5, -18.5, -68.5, 0.1)
+
+def claves_hilbert(geometrias, limites=None):
+    """
+    Distancia de cada geometría sobre una curva de Hilbert (centro de su envolvente).
+    Las geometrías vacías o nulas reciben la clave más alta para quedar al final.
+
+    Args:
+        geometrias (np.ndarray): Arreglo de geometrías shapely.
+        limites (tuple | None): (xmin, ymin, xmax, ymax) de la curva; si es None se usa
+            la envolvente de las geometrías.
+
+    Returns:
+        np.ndarray: Claves uint64 para ordenar.
+    """
+    geometrias = np.asarray(geometrias, dtype=object)
+    validas = ~(shapely.is_missing(geometrias) | shapely.is_empty(geometrias))
+    claves = np.full(len(geometrias), np.iinfo(np.uint32).max + 1, dtype=np.uint64)
+    if validas.any():
+        claves[validas] = gpd.GeoSeries(geometrias[validas]).hilbert_distance(total_bounds=limites).to_numpy()
+    return claves
+
+def calcular_orden(geometrias, orden="hilbert", claves_h3=None, limites=None):
+    """
+    Posiciones que ordenan las filas a lo largo de una curva de Hilbert ("hilbert"),
+    por celda H3 ("h3", usando claves_h3) o en el orden original (None).
+    """
+    if orden == "hilbert":
+        return np.argsort(claves_hilbert(geometrias, limites), kind="stable")
+    elif orden == "h3":
+        if claves_h3 is None:
+            raise ValueError("El orden 'h3' requiere la columna de celdas H3")
+        return np.argsort(np.asarray(claves_h3, dtype=str), kind="stable")
+    elif orden is None:
+        return np.arange(len(geometrias))
+    raise ValueError(f"Orden no soportado: {orden}. Debe ser 'hilbert', 'h3' o None")
+
+def escribir_geoparquet(gdf, output_file, orden="hilbert", columna_h3=None, filas_por_grupo=FILAS_POR_GRUPO):
+    """
+    Guarda un GeoDataFrame como GeoParquet 1.1 ordenado espacialmente y con columna bbox.
+
+    Args:
+        gdf (gpd.GeoDataFrame): Datos a guardar.
+        output_file (str): Ruta del archivo .parquet.
+        orden (str | None): "hilbert", "h3" (por la columna columna_h3) o None.
+        columna_h3 (str | None): Columna con la celda H3 de cada fila (para orden="h3").
+        filas_por_grupo (int): Filas por row group.
+    """
+    claves_h3 = gdf[columna_h3] if columna_h3 else None
+    posiciones = calcular_orden(gdf.geometry.values, orden, claves_h3)
+    ordenado = gdf.iloc[posiciones]
+    if isinstance(gdf.index, pd.RangeIndex):
+        ordenado = ordenado.reset_index(drop=True)
+
+    ordenado.to_parquet(
+        output_file, engine="pyarrow", write_covering_bbox=True, schema_version="1.1.0",
+        row_group_size=filas_por_grupo
+    )
+
+def escribir_geoparquet_particionado(gdf, output_dir, columna_particion, orden="hilbert", columna_h3=None,
+                                     filas_por_grupo=FILAS_POR_GRUPO, metadatos=None):
+    """
+    Guarda un GeoDataFrame como dataset Parquet particionado estilo hive
+    (output_dir/columna=valor/part-0.parquet) y actualiza el manifiesto de particiones
+    (output_dir/_manifiesto.json).
+
+    Solo se reescriben las particiones presentes en gdf; las demás y su entrada en el
+    manifiesto se conservan, así que una actualización regional no toca el resto.
+
+    Args:
+        gdf (gpd.GeoDataFrame): Datos a guardar, con la columna columna_particion.
+        output_dir (str): Carpeta del dataset.
+        columna_particion (str): Columna cuyo valor define la partición (no se guarda en los archivos).
+        orden, columna_h3, filas_por_grupo: Igual que en escribir_geoparquet, dentro de cada partición.
+        metadatos (dict | None): Datos adicionales que se guardan en el manifiesto.
+
+    Returns:
+        dict: Manifiesto con las particiones, sus rutas, filas y bbox.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifiesto_path = os.path.join(output_dir, "_manifiesto.json")  # Con "_" los lectores de datasets lo ignoran
+    particiones = {}
+    metadatos_anteriores = {}
+    if os.path.exists(manifiesto_path):
+        with open(manifiesto_path, "r", encoding="utf-8") as f:
+            anterior = json.load(f)
+        particiones = {p["valor"]: p for p in anterior.pop("particiones")}
+        metadatos_anteriores = {k: v for k, v in anterior.items() if k not in ("columna_particion", "total_filas")}
+
+    for valor, grupo in tqdm(gdf.groupby(columna_particion, sort=True), desc="Escribiendo particiones"):
+        carpeta = os.path.join(output_dir, f"{columna_particion}={valor}")
+        shutil.rmtree(carpeta, ignore_errors=True)
+        os.makedirs(carpeta)
+        ruta = os.path.join(carpeta, "part-0.parquet")
+        escribir_geoparquet(
+            grupo.drop(columns=[columna_particion]).reset_index(drop=True), ruta,
+            orden=orden, columna_h3=columna_h3, filas_por_grupo=filas_por_grupo
+        )
+        particiones[str(valor)] = {
+            "valor": str(valor),
+            "ruta": os.path.relpath(ruta, output_dir).replace(os.sep, "/"),
+            "filas": len(grupo),
+            "bbox": [float(v) for v in grupo.total_bounds],
+        }
+
+    manifiesto = {
+        "columna_particion": columna_particion,
+        **metadatos_anteriores,
+        **(metadatos or {}),
+        "total_filas": sum(p["filas"] for p in particiones.values()),
+        "particiones": [particiones[valor] for valor in sorted(particiones)],
+    }
+    # Escritura atómica: un manifiesto a medio escribir no debe reemplazar al anterior
+    temporal = f"{manifiesto_path}.tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f, ensure_ascii=False, indent=2)
+    os.replace(temporal, manifiesto_path)
+    return manifiesto
+
+class EscritorGeoParquet:
+    """
+    Escribe un GeoParquet 1.1 por bloques sin tener todo el archivo en memoria.
+
+    Cada bloque se ordena (Hilbert o H3) y se escribe como uno o más row groups de
+    hasta filas_por_grupo filas, con la geometría en WKB y su columna bbox. El esquema
+    del primer bloque se usa para todo el archivo. Usar con `with` o llamar a cerrar().
+    Si todos los bloques llegan vacíos, al cerrar se crea el archivo sin filas con el
+    esquema del primero.
+    """
+
+    def __init__(self, output_file, crs="EPSG:4326", tipos_geometria=None, orden="hilbert",
+                 columna_h3=None, limites=None, filas_por_grupo=FILAS_POR_GRUPO):
+        """
+        Args:
+            output_file (str): Ruta del archivo .parquet.
+            crs (str): CRS de las geometrías.
+            tipos_geometria (list | None): Tipos de geometría para los metadatos (p. ej. ["Point"]).
+            orden (str | None): "hilbert", "h3" (por la columna columna_h3) o None.
+            columna_h3 (str | None): Columna con la celda H3 de cada fila (para orden="h3").
+            limites (tuple | None): Envolvente fija de la curva de Hilbert, para que todos
+                los bloques usen la misma curva; si es None se usa la de cada bloque.
+            filas_por_grupo (int): Filas máximas por row group.
+        """
+        self.output_file = output_file
+        self.crs = crs
+        self.tipos_geometria = tipos_geometria or []
+        self.orden = orden
+        self.columna_h3 = columna_h3
+        self.limites = limites
+        self.filas_por_grupo = filas_por_grupo
+        self.esquema = None
+        self.escritor = None
+        self.filas = 0
+
+    def metadatos_geo(self):
+        """Metadatos "geo" de GeoParquet 1.1 con el covering bbox."""
+        return {
+            "version": "1.1.0",
+            "primary_column": "geometry",
+            "columns": {
+                "geometry": {
+                    "encoding": "WKB",
+                    "geometry_types": self.tipos_geometria,
+                    "crs": CRS.from_user_input(self.crs).to_json_dict(),
+                    "covering": {
+                        COLUMNA_BBOX: {campo: [COLUMNA_BBOX, campo] for campo in CAMPOS_BBOX}
+                    },
+                }
+            },
+        }
+
+    def escribir(self, tabla, geometrias):
+        """
+        Agrega un bloque al archivo.
+
+        Args:
+            tabla (pa.Table): Atributos del bloque, sin la geometría.
+            geometrias (np.ndarray): Geometrías shapely alineadas con tabla.
+        """
+        if len(geometrias) == 0:
+            # Solo se guarda el esquema, por si el archivo termina sin filas
+            if self.esquema is None:
+                geometria = pa.array([], pa.binary())
+                bbox = pa.StructArray.from_arrays([pa.array([], pa.float64())] * 4, names=CAMPOS_BBOX)
+                self.esquema = (
+                    tabla.slice(0, 0).append_column("geometry", geometria).append_column(COLUMNA_BBOX, bbox).schema
+                    .with_metadata({"geo": json.dumps(self.metadatos_geo())})
+                )
+            return
+        claves_h3 = tabla[self.columna_h3].to_numpy(zero_copy_only=False) if self.columna_h3 else None
+        posiciones = calcular_orden(geometrias, self.orden, claves_h3, self.limites)
+        geometrias = np.asarray(geometrias, dtype=object)[posiciones]
+
+        limites = shapely.bounds(geometrias)
+        bbox = pa.StructArray.from_arrays([pa.array(limites[:, i]) for i in range(4)], names=CAMPOS_BBOX)
+        tabla = (
+            tabla.take(pa.array(posiciones))
+            .append_column("geometry", pa.array(shapely.to_wkb(geometrias), pa.binary()))
+            .append_column(COLUMNA_BBOX, bbox)
+        )
+
+        if self.escritor is None:
+            self.esquema = tabla.schema.with_metadata({"geo": json.dumps(self.metadatos_geo())})
+            self.escritor = pq.ParquetWriter(self.output_file, self.esquema)
+        self.escritor.write_table(tabla.cast(self.esquema), row_group_size=self.filas_por_grupo)
+        self.filas += tabla.num_rows
+
+    def cerrar(self):
+        """Cierra el archivo (escribe el pie de Parquet)."""
+        if self.escritor is None and self.esquema is not None and self.filas == 0:
+            self.escritor = pq.ParquetWriter(self.output_file, self.esquema)
+        if self.escritor is not None:
+            self.escritor.close()
+            self.escritor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
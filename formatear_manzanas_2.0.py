@@ -1,15 +1,34 @@
-import pandas as pd
+import os
 import json
-import pickle
-from shapely import wkb
+import itertools
+import duckdb
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import shapely
 import geopandas as gpd
-from tqdm import tqdm  # Importar tqdm para la barra de progreso
-import warnings
+import metricas
+from constructor_manzanas import COLUMNAS_UBIGEO, agregar_ubigeo, construir_documentos, escribir_ndjson
 
 # Archivos de entrada y salida
 input_file = "manzanas_sin_formato/manzanas_feb_27_4326.parquet"
 output_file = "ndjson/manzanas_feb_27.ndjson"
-ubigeo_file = "ubigeo_dict.pkl"  # Archivo con los ubigeos
+
+# Modo de procesamiento:
+# - "completo": carga todo el archivo en memoria.
+# - "streaming": lee por lotes y agrupa con un ordenamiento externo en disco (memoria acotada).
+MODO = "completo"
+TAMANO_LOTE = 200000  # Registros por lote leído y por bloque de salida (modo streaming)
+MEMORIA_MAXIMA = "4GB"  # Memoria máxima de DuckDB; el resto del ordenamiento se vuelca a disco
+temp_dir = "manzanas_tmp"  # Carpeta para la base temporal y los volcados a disco
+
+# División de manzanas grandes: máximo de housenumbers por documento (None: un documento por
+# manzana) y si las casas se ordenan por número para que cada parte cubra un rango
+MAX_CASAS_POR_DOCUMENTO = None
+ORDENAR_POR_NUMERO = False
+
+# CRS métrico en el que se calculan los centroides antes de volver a EPSG:4326
+CRS_METRICO = "EPSG:32718"  # Cambiar según la zona UTM correspondiente
 
 #Columnas a usar
 name_manzana="name_manzana"
@@ -17,86 +36,185 @@ name_lote="name_lote"
 name_urb="name_urb"
 postcode="postcode"
 
-# Detectar formato del archivo de entrada
-if input_file.endswith(".ndjson"):
-    df = pd.read_json(input_file, lines=True)
-elif input_file.endswith(".parquet"):
-    df = pd.read_parquet(input_file)
-elif input_file.endswith(".gpkg"):
-    df = gpd.read_file(input_file)
-else:
+def leer_metadatos_geo(input_file):
+    """Devuelve los metadatos "geo" de un archivo GeoParquet, o None si es un parquet simple."""
+    metadatos = pq.read_schema(input_file).metadata or {}
+    return json.loads(metadatos[b"geo"]) if b"geo" in metadatos else None
+
+def leer_entrada(input_file):
+    """Lee el archivo de entrada completo según su formato."""
+    if input_file.endswith(".ndjson"):
+        return pd.read_json(input_file, lines=True)
+    elif input_file.endswith(".parquet"):
+        # GeoParquet (WKB o GeoArrow) se decodifica directamente con su CRS
+        if leer_metadatos_geo(input_file):
+            return gpd.read_parquet(input_file)
+        return pd.read_parquet(input_file)
+    elif input_file.endswith(".gpkg"):
+        return gpd.read_file(input_file)
     raise ValueError("Formato de archivo no soportado. Debe ser .ndjson, .parquet o .gpkg")
 
-# Cargar el diccionario de ubigeos desde el archivo .pkl
-with open(ubigeo_file, "rb") as f:
-    ubigeo_dict = pickle.load(f)
-
-# Filtrar registros donde "manzana" y name_lote no sean vacíos
-if name_manzana in df.columns and name_lote in df.columns:
-    df = df[df[name_manzana].astype(str).str.strip() != ""]
-    df = df[df[name_lote].astype(str).str.strip() != ""]
-else:
-    raise ValueError("Las columnas 'manzana' y 'lote' son obligatorias en el archivo de entrada")
-
-# Extraer lon y lat de la geometría si es un archivo geoespacial
-geometry_col = None
-for col in ["geometry", "geom"]:
-    if col in df.columns:
-        geometry_col = col
-        break
-    
-if input_file.endswith(".parquet"):
-    df[geometry_col] = df[geometry_col].apply(lambda x: wkb.loads(x) if isinstance(x, bytes) else x)
-
-# Si se encontró una columna de geometría, calcular centroides
-if geometry_col:
-    df = gpd.GeoDataFrame(df, geometry=df[geometry_col], crs="EPSG:4326")  # Asegurar que la geometría se reconozca
-    warnings.simplefilter("ignore", category=UserWarning)
-    df["lon"] = df.geometry.centroid.x
-    df["lat"] = df.geometry.centroid.y
-    df.drop(columns=[geometry_col], inplace=True)  
-else:
-    raise ValueError("No se encontró una columna de geometría ('geometry' o 'geom').")
-
-
-# Función para obtener códigos de departamento, provincia y distrito desde el postcode
-def get_ubigeo(postcode):
-    ubigeo = ubigeo_dict.get(int(postcode), {})
-    return (
-        ubigeo.get("cod_departament", None),
-        ubigeo.get("cod_province", None),
-        ubigeo.get("cod_district", None),
-    )
-
-# Aplicar la función a cada fila y crear nuevas columnas
-df[["cod_departament", "cod_province", "cod_district"]] = df[postcode].astype(str).apply(get_ubigeo).apply(pd.Series)
-
-# Agrupar por urbanización y manzana
-grouped = df.groupby([name_urb, name_manzana, postcode, "cod_departament", "cod_province", "cod_district"])
-
-# Transformar los datos en el formato deseado
-output_data = []
-for (urbanizacion, manzana, postcode, cod_departament, cod_province, cod_district), group in tqdm(grouped, desc="Procesando manzanas"):
-    obj = {
-        "id_via":None,
-        "name": urbanizacion,
-        "postcode": postcode,
-        "cod_departament": cod_departament,
-        "cod_province": cod_province,
-        "cod_district": cod_district,
-        "context": manzana,
-        "type": "street",
-        "housenumbers": []
-    }
-    obj["housenumbers"] = [
-        {"number": row[name_lote], "location": {"lon": row["lon"], "lat": row["lat"]}}
-        for _, row in group.iterrows()
-    ]
-    output_data.append(obj)
-
-# Guardar la salida en NDJSON
-with open(output_file, "w", encoding="utf-8") as file:
-    for data in tqdm(output_data, desc="Escribiendo archivo"):
-        file.write(json.dumps(data, ensure_ascii=False, default=str) + "\n")
+def leer_entrada_por_lotes(input_file, tamano_lote=TAMANO_LOTE):
+    """Lee el archivo de entrada por lotes de tamano_lote registros, sin cargarlo completo."""
+    if input_file.endswith(".ndjson"):
+        yield from pd.read_json(input_file, lines=True, chunksize=tamano_lote)
+    elif input_file.endswith(".parquet"):
+        metadatos_geo = leer_metadatos_geo(input_file)
+        if metadatos_geo and any(c.get("encoding", "WKB") != "WKB" for c in metadatos_geo["columns"].values()):
+            raise ValueError("El modo streaming solo admite geometrías en WKB; use MODO = \"completo\"")
+        for batch in pq.ParquetFile(input_file).iter_batches(batch_size=tamano_lote):
+            yield batch.to_pandas()
+    elif input_file.endswith(".gpkg"):
+        for inicio in itertools.count(0, tamano_lote):
+            lote = gpd.read_file(input_file, rows=slice(inicio, inicio + tamano_lote))
+            if lote.empty:
+                break
+            yield lote
+    else:
+        raise ValueError("Formato de archivo no soportado. Debe ser .ndjson, .parquet o .gpkg")
+
+def calcular_centroides(geometrias, crs_metrico=CRS_METRICO):
+    """
+    Calcula lon/lat del centroide de cada geometría.
+
+    La columna se decodifica en bloque con shapely.from_wkb si viene como WKB y el
+    centroide se calcula una sola vez, en crs_metrico, antes de volver a EPSG:4326.
+
+    Args:
+        geometrias (pd.Series | gpd.GeoSeries): Geometrías o WKB; sin CRS se asume EPSG:4326.
+        crs_metrico (str): CRS proyectado para el cálculo del centroide.
+
+    Returns:
+        tuple: (arreglo de lon, arreglo de lat).
+    """
+    if isinstance(geometrias, gpd.GeoSeries):
+        geometrias = gpd.GeoSeries(geometrias.values, crs=geometrias.crs or "EPSG:4326")
+    else:
+        geometrias = gpd.GeoSeries(shapely.from_wkb(geometrias.to_numpy()), crs="EPSG:4326")
+    centroides = geometrias.to_crs(crs_metrico).centroid.to_crs("EPSG:4326")
+    return centroides.x.to_numpy(), centroides.y.to_numpy()
+
+def preparar_registros(df):
+    """Filtra los lotes vacíos, calcula lon/lat desde la geometría y agrega los códigos de ubigeo."""
+    # Filtrar registros donde "manzana" y name_lote no sean vacíos
+    if name_manzana in df.columns and name_lote in df.columns:
+        df = df[df[name_manzana].astype(str).str.strip() != ""]
+        df = df[df[name_lote].astype(str).str.strip() != ""]
+    else:
+        raise ValueError("Las columnas 'manzana' y 'lote' son obligatorias en el archivo de entrada")
+
+    # Buscar la columna de geometría
+    geometry_col = None
+    for col in ["geometry", "geom"]:
+        if col in df.columns:
+            geometry_col = col
+            break
+    if not geometry_col:
+        raise ValueError("No se encontró una columna de geometría ('geometry' o 'geom').")
+
+    # Extraer lon y lat del centroide de cada geometría
+    lon, lat = calcular_centroides(df[geometry_col])
+    df = pd.DataFrame(df.drop(columns=[geometry_col])).assign(lon=lon, lat=lat)
+
+    # Agregar códigos de departamento, provincia y distrito con un join sobre el postcode
+    return agregar_ubigeo(df, df[postcode])
+
+def agrupar_en_disco(lotes, claves, columnas, temp_dir=temp_dir, memoria_maxima=MEMORIA_MAXIMA, tamano_lote=TAMANO_LOTE):
+    """
+    Vuelca los lotes en una base DuckDB en disco y los devuelve ordenados por las claves
+    de agrupación, en bloques de alrededor de tamano_lote filas que contienen grupos completos.
+
+    DuckDB ordena con memory_limit y vuelca a temp_dir lo que no cabe en memoria, así
+    que la memoria usada no depende del tamaño de la entrada. La columna "fila" conserva
+    el orden original de las casas dentro de cada grupo.
+
+    Yields:
+        pd.DataFrame: Bloque ordenado; ningún grupo queda repartido entre dos bloques.
+    """
+    os.makedirs(temp_dir, exist_ok=True)
+    db_path = os.path.join(temp_dir, "manzanas.duckdb")
+    if os.path.exists(db_path):
+        os.remove(db_path)  # Restos de una ejecución interrumpida
+
+    try:
+        with duckdb.connect(database=db_path) as conn:
+            conn.execute(f"SET memory_limit = '{memoria_maxima}'")
+            conn.execute(f"SET temp_directory = '{temp_dir}'")
+
+            # Volcar los lotes a disco, sin las filas que groupby descartaría por claves nulas
+            # (los lotes se leen y preparan a medida que se consumen)
+            total = 0
+            tabla_creada = False
+            with metricas.etapa("leer_preparar_y_volcar") as etapa:
+                for lote in lotes:
+                    lote = lote.dropna(subset=claves)[columnas]
+                    lote = lote.assign(fila=np.arange(total, total + len(lote)))
+                    conn.register("lote", lote)
+                    if not tabla_creada:
+                        conn.execute("CREATE TABLE registros AS SELECT * FROM lote")
+                        tabla_creada = True
+                    else:
+                        conn.execute("INSERT INTO registros BY NAME SELECT * FROM lote")
+                    conn.unregister("lote")
+                    total += len(lote)
+                    print(f"Registros volcados a disco: {total}")
+                etapa["filas"] = total
+            if total == 0:
+                return
+
+            # Leer ordenado por bloques; el último grupo de cada bloque pasa al siguiente
+            orden = ", ".join(f'"{clave}"' for clave in claves)
+            lector = conn.execute(f"SELECT * EXCLUDE (fila) FROM registros ORDER BY {orden}, fila").fetch_record_batch(tamano_lote)
+            pendiente = None
+            for batch in lector:
+                bloque = batch.to_pandas()
+                if pendiente is not None:
+                    bloque = pd.concat([pendiente, bloque], ignore_index=True)
+                distinto_al_ultimo = ~(bloque[claves] == bloque[claves].iloc[-1]).all(axis=1).to_numpy()
+                corte = np.flatnonzero(distinto_al_ultimo)[-1] + 1 if distinto_al_ultimo.any() else 0
+                if corte > 0:
+                    yield bloque.iloc[:corte]
+                pendiente = bloque.iloc[corte:]
+            if pendiente is not None and len(pendiente):
+                yield pendiente
+    finally:
+        if os.path.exists(db_path):
+            os.remove(db_path)
+
+def formatear_streaming(input_file):
+    """Genera los documentos de manzana leyendo y agrupando por lotes con memoria acotada."""
+    claves = [name_urb, name_manzana, postcode] + COLUMNAS_UBIGEO
+    columnas = [name_urb, name_manzana, name_lote, postcode, "lon", "lat"] + COLUMNAS_UBIGEO
+    lotes = (preparar_registros(lote) for lote in leer_entrada_por_lotes(input_file))
+    for bloque in agrupar_en_disco(lotes, claves, columnas):
+        yield from construir_documentos(
+            bloque, name_urb, name_manzana, name_lote, postcode,
+            max_casas=MAX_CASAS_POR_DOCUMENTO, ordenar_por_numero=ORDENAR_POR_NUMERO
+        )
+
+# Tiempos, filas y memoria de la corrida en metricas.jsonl
+parametros = {"input_file": input_file, "modo": MODO, "max_casas": MAX_CASAS_POR_DOCUMENTO, "ordenar_por_numero": ORDENAR_POR_NUMERO}
+with metricas.Ejecucion("formatear_manzanas_2.0", parametros):
+    if MODO == "streaming":
+        # Los documentos se escriben a medida que se completa cada grupo; la etapa de
+        # escritura incluye la de volcado a disco, que ocurre al pedir el primer documento
+        documentos = formatear_streaming(input_file)
+    else:
+        with metricas.etapa("leer") as etapa:
+            df = leer_entrada(input_file)
+            etapa["filas"] = len(df)
+        with metricas.etapa("preparar") as etapa:
+            df = preparar_registros(df)
+            etapa["filas"] = len(df)
+
+        # Agrupar por urbanización y manzana y construir un documento por grupo
+        documentos = construir_documentos(
+            df, name_urb, name_manzana, name_lote, postcode,
+            max_casas=MAX_CASAS_POR_DOCUMENTO, ordenar_por_numero=ORDENAR_POR_NUMERO
+        )
+
+    # Guardar la salida en NDJSON (los documentos se construyen al escribirlos)
+    with metricas.etapa("construir_y_escribir") as etapa:
+        etapa["filas"] = escribir_ndjson(documentos, output_file)
 
 print(f"Archivo formateado guardado en {output_file}")
@@ -0,0 +1,236 @@
+import os
+import numpy as np
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import shapely
+from tqdm import tqdm  # Barra de progreso
+from convertir_ndjson_a_parquet import COLUMNAS, leer_bloques, aplanar_bloque
+
+# Índice de puntas de puerta en Arrow IPC, ordenado por celda de una grilla lon/lat
+indice_file = "geocodificador.arrow"
+
+# Archivos NDJSON generados por el pipeline (calles y manzanas) que se indexan
+ndjson_files = ["ndjson/calles.ndjson", "ndjson/manzanas_feb_27.ndjson"]
+
+TAMANO_CELDA = 0.0005  # Lado de la celda de la grilla en grados (~55 m)
+DISTANCIA_MAXIMA = 500  # Metros; más lejos de esto no se devuelve ninguna casa
+TAMANO_LOTE = 50000  # Puntos consultados juntos (acota la memoria de los candidatos)
+RADIO_TIERRA = 6371008.8  # Metros
+
+# Atributos de cada casa que se guardan en el índice
+COLUMNAS_INDICE = COLUMNAS + ["number"]
+
+# Índices ya cargados, por ruta, y sus columnas de texto ya decodificadas, por (ruta, columna)
+_indices = {}
+_nombres = {}
+
+def celdas_de_puntos(lons, lats, tamano_celda=TAMANO_CELDA):
+    """
+    Fila y columna de la grilla de cada punto y la cantidad de columnas de la grilla;
+    la celda de un punto es fila * columnas + columna.
+    """
+    columnas = int(np.ceil(360 / tamano_celda)) + 1
+    ix = np.floor((np.asarray(lons, dtype=np.float64) + 180) / tamano_celda).astype(np.int64)
+    iy = np.floor((np.asarray(lats, dtype=np.float64) + 90) / tamano_celda).astype(np.int64)
+    return ix, iy, columnas
+
+def construir_indice(ndjson_files=ndjson_files, indice_path=indice_file, tamano_celda=TAMANO_CELDA):
+    """
+    Guarda en Arrow IPC una fila por housenumber de los NDJSON, ordenada por celda.
+
+    Las coordenadas se guardan en float32 (error menor a un metro) y los atributos de
+    texto con codificación de diccionario, así el índice ocupa poco y se mapea en memoria.
+
+    Args:
+        ndjson_files (list): Archivos NDJSON con documentos de calles o manzanas.
+        indice_path (str): Ruta del archivo .arrow.
+        tamano_celda (float): Lado de la celda de la grilla en grados.
+    """
+    partes, lons, lats = [], [], []
+    for ndjson_file in ndjson_files:
+        with tqdm(total=os.path.getsize(ndjson_file), unit="B", unit_scale=True, desc=f"Indexando {ndjson_file}") as barra:
+            for tabla, leidos in leer_bloques(ndjson_file):
+                barra.update(leidos)
+                bloque = aplanar_bloque(tabla)
+                if bloque is None:
+                    continue
+                tabla_puntos, puntos = bloque
+                x, y = shapely.get_x(puntos), shapely.get_y(puntos)
+                validos = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+
+                # Mismos tipos en todos los archivos: id_via entero y el resto texto
+                partes.append(pa.table({
+                    columna: tabla_puntos[columna].cast(pa.int64() if columna == "id_via" else pa.string()).take(validos)
+                    for columna in COLUMNAS_INDICE
+                }))
+                lons.append(x[validos].astype(np.float32))
+                lats.append(y[validos].astype(np.float32))
+    if not partes:
+        raise ValueError("Los archivos NDJSON no tienen housenumbers con ubicación")
+
+    lons, lats = np.concatenate(lons), np.concatenate(lats)
+    ix, iy, columnas = celdas_de_puntos(lons, lats, tamano_celda)
+    celdas = iy * columnas + ix
+    orden = np.argsort(celdas, kind="stable")
+
+    atributos = pa.concat_tables(partes).combine_chunks().take(pa.array(orden))
+    tabla = pa.table({
+        "celda": pa.array(celdas[orden]),
+        "lon": pa.array(lons[orden]),
+        "lat": pa.array(lats[orden]),
+        **{
+            columna: atributos[columna] if columna == "id_via" else atributos[columna].combine_chunks().dictionary_encode()
+            for columna in COLUMNAS_INDICE
+        },
+    }).replace_schema_metadata({"tamano_celda": repr(tamano_celda)})
+    with pa.OSFile(indice_path, "wb") as sink, ipc.new_file(sink, tabla.schema) as writer:
+        writer.write_table(tabla)
+    _indices.pop(indice_path, None)
+    for clave in [clave for clave in _nombres if clave[0] == indice_path]:
+        del _nombres[clave]
+    print(f"Índice guardado en {indice_path} ({tabla.num_rows} casas)")
+
+def cargar_indice(indice_path=indice_file):
+    """Devuelve el índice como pa.Table, mapeando el archivo en memoria la primera vez."""
+    if indice_path not in _indices:
+        with pa.memory_map(indice_path) as source:
+            _indices[indice_path] = ipc.open_file(source).read_all().combine_chunks()
+    return _indices[indice_path]
+
+def _distancias(lon1, lat1, lon2, lat2):
+    """Distancia en metros (aproximación equirectangular, exacta a escala de cuadras)."""
+    x = np.radians(lon2 - lon1) * np.cos(np.radians((lat1 + lat2) / 2))
+    y = np.radians(lat2 - lat1)
+    return RADIO_TIERRA * np.hypot(x, y)
+
+def _mas_cercanos(celdas, lons_indice, lats_indice, lons, lats, ix, iy, columnas, radio):
+    """
+    Casa más cercana a cada punto entre las celdas a lo sumo a `radio` celdas de la suya.
+
+    En cada fila de la grilla las celdas del cuadrado son claves consecutivas, así que
+    los candidatos salen de 2 * radio + 1 rangos por punto buscados con searchsorted.
+
+    Returns:
+        tuple: (posición en el índice o -1, distancia en metros o inf).
+    """
+    filas = (iy[:, None] + np.arange(-radio, radio + 1)[None, :]) * columnas
+    inicios = np.searchsorted(celdas, filas + (ix - radio)[:, None], "left").ravel()
+    cuentas = np.searchsorted(celdas, filas + (ix + radio)[:, None], "right").ravel() - inicios
+
+    # Un candidato por casa de cada rango: (punto consultado, posición en el índice)
+    consulta = np.repeat(np.arange(len(ix)).repeat(2 * radio + 1), cuentas)
+    desplazamientos = np.arange(cuentas.sum()) - np.repeat(np.cumsum(cuentas) - cuentas, cuentas)
+    posiciones = np.repeat(inicios, cuentas) + desplazamientos
+    distancias = _distancias(
+        lons[consulta], lats[consulta],
+        lons_indice[posiciones].astype(np.float64), lats_indice[posiciones].astype(np.float64)
+    )
+
+    # Los candidatos de cada punto son un tramo contiguo: mínimo por tramo sin ordenar
+    mejor = np.full(len(ix), -1, dtype=np.int64)
+    distancia = np.full(len(ix), np.inf)
+    if len(consulta) == 0:
+        return mejor, distancia
+    inicios_tramo = np.flatnonzero(np.r_[True, consulta[1:] != consulta[:-1]])
+    minimos = np.minimum.reduceat(distancias, inicios_tramo)
+    con_candidatos = consulta[inicios_tramo]
+    tramo = np.repeat(np.arange(len(inicios_tramo)), np.diff(np.r_[inicios_tramo, len(consulta)]))
+    # Primer candidato de cada tramo que alcanza el mínimo
+    es_minimo = np.flatnonzero(distancias == minimos[tramo])
+    primeros = es_minimo[np.r_[True, tramo[es_minimo][1:] != tramo[es_minimo][:-1]]]
+    mejor[con_candidatos] = posiciones[primeros]
+    distancia[con_candidatos] = minimos
+    return mejor, distancia
+
+def _buscar_lote(celdas, lons_indice, lats_indice, lons, lats, tamano_celda, distancia_maxima):
+    """
+    Busca la casa más cercana de un lote de puntos ampliando el cuadrado de celdas solo
+    para los puntos cuyo mejor candidato podría no ser el más cercano.
+    """
+    mejor = np.full(len(lons), -1, dtype=np.int64)
+    distancia = np.full(len(lons), np.inf)
+    validos = np.isfinite(lons) & np.isfinite(lats)
+    lons, lats = np.where(validos, lons, 0), np.where(validos, lats, 0)
+    ix, iy, columnas = celdas_de_puntos(lons, lats, tamano_celda)
+
+    # Ancho mínimo de una celda en metros cerca de cada punto: todo lo que esté a menos de
+    # radio * lado metros cae dentro del cuadrado de ese radio
+    lado = np.radians(tamano_celda) * RADIO_TIERRA * np.clip(np.cos(np.radians(np.abs(lats) + tamano_celda)), 0.01, 1)
+    radio_maximo = np.maximum(np.ceil(distancia_maxima / lado), 1).astype(np.int64)
+    pendientes = np.flatnonzero(validos)
+
+    radio = 1
+    while len(pendientes):
+        posiciones, distancias = _mas_cercanos(
+            celdas, lons_indice, lats_indice, lons[pendientes], lats[pendientes],
+            ix[pendientes], iy[pendientes], columnas, radio
+        )
+        mejora = distancias < distancia[pendientes]
+        mejor[pendientes[mejora]] = posiciones[mejora]
+        distancia[pendientes[mejora]] = distancias[mejora]
+
+        resueltos = (distancia[pendientes] <= radio * lado[pendientes]) | (radio >= radio_maximo[pendientes])
+        pendientes = pendientes[~resueltos]
+        if len(pendientes):
+            radio = min(radio * 2, int(radio_maximo[pendientes].max()))
+
+    lejos = distancia > distancia_maxima
+    mejor[lejos] = -1
+    distancia[lejos] = np.nan
+    return mejor, distancia
+
+def buscar_cercanos(lons, lats, columnas=COLUMNAS_INDICE, distancia_maxima=DISTANCIA_MAXIMA,
+                    indice_path=indice_file, tamano_lote=TAMANO_LOTE):
+    """
+    Geocodificación inversa en bloque: la casa más cercana a cada punto lon/lat.
+
+    Args:
+        lons, lats (array-like): Coordenadas en EPSG:4326.
+        columnas (list): Atributos del índice a devolver.
+        distancia_maxima (float): Distancia máxima en metros.
+        indice_path (str): Ruta del archivo .arrow.
+        tamano_lote (int): Puntos que se buscan juntos.
+
+    Returns:
+        dict: columna -> np.ndarray (object) alineado con los puntos, más "lon", "lat" de la
+        casa y "distancia" en metros; None (NaN en las numéricas) si no hay casa cerca.
+    """
+    tabla = cargar_indice(indice_path)
+    tamano_celda = float(tabla.schema.metadata[b"tamano_celda"])
+    celdas = tabla["celda"].to_numpy()
+    lons_indice, lats_indice = tabla["lon"].to_numpy(), tabla["lat"].to_numpy()
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+
+    posiciones = np.full(len(lons), -1, dtype=np.int64)
+    distancias = np.full(len(lons), np.nan)
+    for inicio in range(0, len(lons), tamano_lote):
+        lote = slice(inicio, inicio + tamano_lote)
+        posiciones[lote], distancias[lote] = _buscar_lote(
+            celdas, lons_indice, lats_indice, lons[lote], lats[lote], tamano_celda, distancia_maxima
+        )
+
+    encontrados = posiciones >= 0
+    resultado = {}
+    for columna in columnas:
+        valores = tabla[columna].chunk(0)
+        resultado[columna] = np.full(len(lons), None, dtype=object)
+        if pa.types.is_dictionary(valores.type):
+            # El diccionario se decodifica una sola vez; el índice extra es el valor nulo
+            if (indice_path, columna) not in _nombres:
+                _nombres[indice_path, columna] = (
+                    np.array(valores.dictionary.to_pylist() + [None], dtype=object),
+                    valores.indices.fill_null(len(valores.dictionary)).to_numpy(),
+                )
+            nombres, indices = _nombres[indice_path, columna]
+            resultado[columna][encontrados] = nombres[indices[posiciones[encontrados]]]
+        else:
+            resultado[columna][encontrados] = valores.take(pa.array(posiciones[encontrados])).to_pylist()
+    for columna, valores in (("lon", lons_indice), ("lat", lats_indice)):
+        resultado[columna] = np.full(len(lons), np.nan)
+        resultado[columna][encontrados] = valores[posiciones[encontrados]]
+    resultado["distancia"] = distancias
+    return resultado
+
+if __name__ == "__main__":
+    construir_indice(ndjson_files, indice_file)
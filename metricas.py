@@ -0,0 +1,171 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource  # No existe en Windows: ahí el pico de RSS queda en None
+except ImportError:
+    resource = None
+
+# Archivo JSON-lines donde cada script agrega una línea por etapa y una de resumen por ejecución
+metricas_file = "metricas.jsonl"
+
+PERFIL_CPU = False  # cProfile de toda la ejecución: guarda un .prof y las funciones más costosas
+PERFIL_MEMORIA = False  # tracemalloc: pico de memoria de Python por etapa (hace más lento el proceso)
+FUNCIONES_TOP = 15  # Funciones del perfil de CPU que se copian al resumen
+
+# Ejecución en curso en este proceso (la que registran las etapas)
+_ejecucion = None
+
+def _rss_pico_mb(hijos=False):
+    """Pico de RSS en MB del proceso (o de sus hijos ya terminados), o None si no se puede medir."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_CHILDREN if hijos else resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa KB y macOS bytes
+    return round(pico / (1024 ** 2 if sys.platform == "darwin" else 1024), 1)
+
+def _rss_actual_mb():
+    """RSS actual en MB (Linux), o None si no se puede medir."""
+    try:
+        with open("/proc/self/statm") as f:
+            paginas = int(f.read().split()[1])
+        return round(paginas * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2, 1)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+class Ejecucion:
+    """
+    Métricas de una ejecución de un script. Usar con `with` alrededor del script y medir
+    sus partes con etapa(): cada etapa se agrega al archivo apenas termina (un fallo a
+    mitad de la ejecución conserva lo ya medido) y al salir se agrega el resumen.
+
+    Todas las líneas llevan "script" y "ejecucion" (fecha y pid) para comparar corridas.
+    """
+
+    def __init__(self, script, parametros=None, metricas_path=metricas_file,
+                 perfil_cpu=PERFIL_CPU, perfil_memoria=PERFIL_MEMORIA):
+        """
+        Args:
+            script (str): Nombre del script.
+            parametros (dict | None): Configuración de la corrida (modo, archivos, etc.).
+            metricas_path (str): Ruta del archivo JSON-lines.
+            perfil_cpu (bool): Perfilar con cProfile; el .prof queda junto al archivo de métricas.
+            perfil_memoria (bool): Medir el pico de memoria de Python por etapa con tracemalloc.
+        """
+        self.script = script
+        self.parametros = parametros or {}
+        self.metricas_path = metricas_path
+        self.perfil_cpu = perfil_cpu
+        self.perfil_memoria = perfil_memoria
+        self.id = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+        self.etapas = {}
+        self.perfilador = None
+
+    def registrar(self, registro):
+        """Agrega una línea al archivo de métricas."""
+        linea = {"script": self.script, "ejecucion": self.id, **registro}
+        with open(self.metricas_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(linea, ensure_ascii=False, default=str) + "\n")
+
+    def __enter__(self):
+        global _ejecucion
+        if _ejecucion is not None:
+            raise RuntimeError(f"Ya hay una ejecución en curso ({_ejecucion.script})")
+        _ejecucion = self
+        self.fecha = datetime.now().isoformat(timespec="seconds")
+        self.inicio = time.perf_counter()
+        if self.perfil_memoria and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.perfil_cpu:
+            self.perfilador = cProfile.Profile()
+            self.perfilador.enable()
+        return self
+
+    def __exit__(self, tipo, error, traza):
+        global _ejecucion
+        segundos = time.perf_counter() - self.inicio
+        resumen = {
+            "tipo": "ejecucion",
+            "inicio": self.fecha,
+            "parametros": self.parametros,
+            "segundos": round(segundos, 3),
+            "etapas": self.etapas,
+            "rss_pico_mb": _rss_pico_mb(),
+            "rss_pico_hijos_mb": _rss_pico_mb(hijos=True),
+            "error": f"{tipo.__name__}: {error}" if tipo else None,
+        }
+
+        if self.perfilador is not None:
+            self.perfilador.disable()
+            base, _ = os.path.splitext(self.metricas_path)
+            resumen["perfil"] = f"{base}_{self.script}_{self.id}.prof"
+            self.perfilador.dump_stats(resumen["perfil"])
+            estadisticas = pstats.Stats(self.perfilador)
+            funciones = sorted(estadisticas.stats.items(), key=lambda item: item[1][3], reverse=True)
+            resumen["funciones_top"] = [
+                {
+                    "funcion": f"{archivo}:{linea}({nombre})",
+                    "llamadas": llamadas,
+                    "segundos_propios": round(propio, 3),
+                    "segundos_acumulados": round(acumulado, 3),
+                }
+                for (archivo, linea, nombre), (_, llamadas, propio, acumulado, _) in funciones[:FUNCIONES_TOP]
+            ]
+        if self.perfil_memoria and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+        self.registrar(resumen)
+        _ejecucion = None
+        return False
+
+@contextmanager
+def etapa(nombre, filas=None):
+    """
+    Mide una etapa de la ejecución en curso: segundos, filas, filas por segundo, RSS
+    actual y pico, y pico de tracemalloc si está activo. Sin ejecución en curso (p. ej.
+    cuando una función se usa desde otro script) no registra nada.
+
+    Las filas se pueden indicar al entrar o, si se conocen al final, asignarlas en el
+    dict que devuelve: `with etapa("leer") as e: ...; e["filas"] = len(df)`. Otras
+    claves que se agreguen a ese dict se guardan tal cual.
+
+    Si una etapa se anida en otra, el pico de tracemalloc de la externa se reinicia.
+    """
+    datos = {"filas": filas}
+    ejecucion = _ejecucion
+    if ejecucion is None:
+        yield datos
+        return
+
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    inicio = time.perf_counter()
+    error = None
+    try:
+        yield datos
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        segundos = time.perf_counter() - inicio
+        filas = datos.pop("filas", None)
+        ejecucion.etapas[nombre] = round(ejecucion.etapas.get(nombre, 0) + segundos, 3)
+        ejecucion.registrar({
+            "tipo": "etapa",
+            "etapa": nombre,
+            "segundos": round(segundos, 3),
+            "filas": filas,
+            "filas_por_segundo": round(filas / segundos, 1) if filas and segundos > 0 else None,
+            "rss_mb": _rss_actual_mb(),
+            "rss_pico_mb": _rss_pico_mb(),
+            "tracemalloc_pico_mb": round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 1) if tracemalloc.is_tracing() else None,
+            **datos,
+            "error": error,
+        })
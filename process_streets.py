@@ -1,12 +1,22 @@
 import duckdb
+import glob
 import json
-import pandas as pd
-import numpy as np
+import os
+import shutil
+import metricas
+import ubigeo
 
 file_path = "data/puertas_para_elasti.parquet"
-postcode_file = "ubigeo_dict.pkl"
+postcode_file = "ubigeo.arrow"
 output_file = "ndjson/calles.ndjson"
 limit = 100000000
+diagnostico_db = "data/diagnostico.duckdb"  # Base DuckDB persistente para el diagnóstico
+reporte_diagnostico = "data/reporte_diagnostico.json"
+
+# División de calles largas: máximo de housenumbers por documento (None: un documento por
+# calle) y si las puertas se ordenan por número para que cada parte cubra un rango
+MAX_CASAS_POR_DOCUMENTO = None
+ORDENAR_POR_NUMERO = False
 
 def info(file_path, limit):
     with duckdb.connect(database=':memory:') as conn:
@@ -84,10 +94,21 @@ def find_duplicate_details(file_path, limit):
         else:
             print("No se encontraron filas duplicadas.")
 
-def split_duplicates_into_files(file_path, limit, output_prefix):
+def split_duplicates_into_files(file_path, limit, output_prefix, formato="csv"):
+    """
+    Divide las filas duplicadas (mismo id_via y numpuerta) en grupos: el grupo i
+    contiene la i-ésima fila de cada duplicado.
+
+    row_number() OVER (PARTITION BY id_via, numpuerta) asigna el grupo de cada fila y
+    DuckDB escribe las particiones directamente, así que el tiempo crece linealmente
+    con la cantidad de duplicados. Los archivos quedan en output_prefix/grupo=<i>/
+    en formato "csv" o "parquet". Las carpetas grupo=<i>/ de una ejecución anterior
+    se borran antes de escribir, para no mezclar grupos viejos con los nuevos.
+    """
     with duckdb.connect(database=':memory:') as conn:
-        # Ejecutar la consulta para obtener los datos duplicados
-        query = f"""
+        # Numerar las filas de cada duplicado; cada número es un grupo de salida
+        conn.execute(f"""
+            CREATE TEMPORARY TABLE duplicate_rows AS
             WITH grouped_data AS (
                 SELECT 
                     id_via,
@@ -100,46 +121,33 @@ def split_duplicates_into_files(file_path, limit, output_prefix):
                 FROM '{file_path}'
                 LIMIT {limit}
             ),
-            duplicates AS (
-                SELECT id_via, numpuerta
+            numbered AS (
+                SELECT
+                    *,
+                    ROW_NUMBER() OVER (PARTITION BY id_via, numpuerta ORDER BY lon_x, lat_y) AS grupo,
+                    COUNT(*) OVER (PARTITION BY id_via, numpuerta) AS total
                 FROM grouped_data
-                GROUP BY id_via, numpuerta
-                HAVING COUNT(*) > 1
             )
-            SELECT g.*
-            FROM grouped_data g
-            INNER JOIN duplicates d
-            ON g.id_via = d.id_via AND g.numpuerta = d.numpuerta
-            ORDER BY g.id_via, g.numpuerta
-        """
-        
-        # Obtener los detalles de los duplicados en un DataFrame
-        duplicate_details_df = conn.execute(query).fetchdf()
-
-    if not duplicate_details_df.empty:
-        # Obtener los duplicados agrupados por id_via y numpuerta
-        grouped_duplicates = duplicate_details_df.groupby(['id_via', 'numpuerta'])
-
-        # Determinar el número máximo de duplicados para dividir en esa cantidad de grupos
-        max_duplicates = grouped_duplicates.size().max()
-
-        # Crear una lista de DataFrames para almacenar los grupos divididos
-        groups = [pd.DataFrame() for _ in range(max_duplicates)]
+            SELECT id_via, numpuerta, tipo_via, nom_via, ubigeo, lon_x, lat_y, grupo
+            FROM numbered
+            WHERE total > 1
+        """)
 
-        # Iterar sobre los grupos y dividir los datos en la cantidad de grupos determinada
-        for _, group in grouped_duplicates:
-            for i, row in enumerate(group.itertuples(index=False)):
-                groups[i % max_duplicates] = pd.concat([groups[i % max_duplicates], pd.DataFrame([row._asdict()])], ignore_index=True)
+        max_duplicates = conn.execute("SELECT MAX(grupo) FROM duplicate_rows").fetchone()[0]
+        for carpeta in glob.glob(os.path.join(output_prefix, "grupo=*")):
+            shutil.rmtree(carpeta, ignore_errors=True)
+        if max_duplicates is None:
+            print("No se encontraron filas duplicadas.")
+            return
 
-        # Guardar los datos en archivos CSV separados
-        for i, group_df in enumerate(groups):
-            if not group_df.empty:
-                output_file = f"{output_prefix}_group_{i + 1}.csv"
-                group_df.to_csv(output_file, index=False)
+        # Guardar cada grupo en su propia partición
+        opciones = "FORMAT CSV, HEADER" if formato == "csv" else "FORMAT PARQUET"
+        conn.execute(f"""
+            COPY (SELECT * FROM duplicate_rows ORDER BY id_via, numpuerta)
+            TO '{output_prefix}' ({opciones}, PARTITION_BY (grupo), OVERWRITE_OR_IGNORE)
+        """)
 
-        print(f"Datos duplicados divididos en {len(groups)} archivos.")
-    else:
-        print("No se encontraron filas duplicadas.")
+    print(f"Datos duplicados divididos en {max_duplicates} archivos.")
 
 def get_unique_rows(file_path, limit):
     with duckdb.connect(database=':memory:') as conn:
@@ -295,58 +303,68 @@ def find_duplicate_details_of_unique(file_path, limit):
         else:
             print("No se encontraron filas duplicadas.")
 
-def use_duckdb_unique(file_path, postcode_file, output_file, limit):
-    # Cargar el archivo .pkl con información adicional de postcode
-    postcode_data = pd.read_pickle(postcode_file)
+def use_duckdb_unique(file_path, postcode_file, output_file, limit, max_casas=MAX_CASAS_POR_DOCUMENTO,
+                      ordenar_por_numero=ORDENAR_POR_NUMERO):
+    """
+    Genera el NDJSON de calles (un documento por calle con sus housenumbers).
 
-    # Convertir el diccionario de postcode a un DataFrame de DuckDB
-    postcode_df = pd.DataFrame(postcode_data).T.reset_index()
-    postcode_df.columns = ['postcode', 'cod_departament', 'cod_province', 'cod_district', 'context']
+    DuckDB agrupa y escribe el NDJSON directamente con COPY ... (FORMAT JSON), sin
+    pasar el resultado por pandas, así que la memoria no crece con el tamaño del archivo.
+    Aunque DuckDB no conserva el orden de las filas, cada documento sale igual en cada
+    corrida: la fila que queda por puerta y el orden de housenumbers son deterministas,
+    así la carga incremental no ve cambios donde no los hay.
+
+    Con max_casas, las calles con más puertas se dividen en varios documentos de hasta
+    max_casas housenumbers con parent_id común (el sha1 que generar_id le da a la calle
+    sin dividir) y part/parts. Las puertas se ordenan como texto o, con
+    ordenar_por_numero, por su parte numérica inicial, así cada parte cubre un rango
+    de números.
+    """
+    # Orden de las puertas dentro de la calle, siempre con numpuerta como desempate
+    # (es única por calle tras el DISTINCT ON): numérico o como texto
+    orden_puertas = (
+        "ORDER BY TRY_CAST(regexp_extract(numpuerta, '^\\s*(\\d+)', 1) AS BIGINT) NULLS LAST, numpuerta"
+        if ordenar_por_numero else "ORDER BY numpuerta"
+    )
+    if max_casas is None:
+        parte = ""
+        campos_parte = ""
+        clave_parte = ""
+    else:
+        # Número de parte de cada puerta según su posición dentro de la calle
+        parte = f", (ROW_NUMBER() OVER (PARTITION BY id_via, name, postcode {orden_puertas}) - 1) // {int(max_casas)} AS parte"
+        campos_parte = """
+                sha1(CASE WHEN g.id_via IS NULL
+                    THEN concat_ws('|', '', COALESCE(CAST(g.postcode AS VARCHAR), ''), COALESCE(p.context, ''), COALESCE(g.name, ''))
+                    ELSE concat_ws('|', CAST(g.id_via AS VARCHAR), COALESCE(CAST(g.postcode AS VARCHAR), ''), COALESCE(p.context, ''))
+                END) AS parent_id,
+                g.parte + 1 AS part,
+                MAX(g.parte) OVER (PARTITION BY g.id_via, g.name, g.postcode) + 1 AS parts,"""
+        clave_parte = ", g.parte"
 
     with duckdb.connect(database=':memory:') as conn:
-        # Registrar el DataFrame de postcode en DuckDB
-        conn.register('postcode_data', postcode_df)
+        # Registrar la tabla de ubigeos (Arrow) en DuckDB
+        ubigeo.registrar_en_duckdb(conn, 'postcode_data', postcode_file)
+        # Permite a DuckDB escribir en streaming sin conservar el orden de las filas
+        conn.execute("SET preserve_insertion_order = false")
 
-        # Crear una tabla temporal para simplificar la consulta
-        conn.execute(f"""
-            CREATE TEMPORARY TABLE temp_unique_rows AS
-            WITH grouped_data AS (
-                SELECT 
+        # Una única consulta que elimina duplicados, hace el join y agrupa por calle;
+        # el orden de las columnas es el orden de las claves de cada documento
+        query = f"""
+            WITH unique_rows AS (
+                SELECT DISTINCT ON (id_via, numpuerta)
                     id_via,
-                    numpuerta,
                     tipo_via || ' ' || nom_via AS name,
                     ubigeo AS postcode,
+                    CAST(numpuerta AS VARCHAR) AS numpuerta,
                     lon_x AS lon,
                     lat_y AS lat
                 FROM '{file_path}'
+                -- Entre filas repetidas de una puerta se queda siempre la misma
+                ORDER BY id_via, numpuerta, lon_x, lat_y, tipo_via, nom_via, ubigeo
             ),
-            duplicates AS (
-                SELECT id_via, numpuerta
-                FROM grouped_data
-                GROUP BY id_via, numpuerta
-                HAVING COUNT(*) > 1
-            )
-            SELECT DISTINCT ON (id_via, numpuerta)
-                id_via,
-                name,
-                postcode,
-                numpuerta,
-                lon,
-                lat
-            FROM grouped_data
-        """)
-        
-        # Ejecutar una única consulta que haga el join y el agrupamiento necesario
-        query = f"""
-            WITH grouped_data AS (
-                SELECT 
-                    id_via,
-                    name,
-                    postcode,
-                    numpuerta,
-                    lon,
-                    lat
-                FROM temp_unique_rows
+            numbered_rows AS (
+                SELECT *{parte} FROM unique_rows
             )
             SELECT
                 g.id_via,
@@ -356,45 +374,126 @@ def use_duckdb_unique(file_path, postcode_file, output_file, limit):
                 p.cod_province,
                 p.cod_district,
                 p.context,
+                'street' AS type,{campos_parte}
                 ARRAY_AGG(
                     STRUCT_PACK(
-                        number := CAST(g.numpuerta AS VARCHAR),
+                        number := g.numpuerta,
                         location := STRUCT_PACK(lon := g.lon, lat := g.lat)
-                    )
+                    ) {orden_puertas}
                 ) AS housenumbers
-            FROM grouped_data g
+            FROM numbered_rows g
             LEFT JOIN postcode_data p
             ON g.postcode = p.postcode
-            GROUP BY g.id_via, g.name, g.postcode, p.cod_departament, p.cod_province, p.cod_district, p.context
+            GROUP BY g.id_via, g.name, g.postcode, p.cod_departament, p.cod_province, p.cod_district, p.context{clave_parte}
         """
 
-        result_df = conn.execute(query).fetchdf()
-
-    # Crear y guardar cada registro directamente en el archivo NDJSON
-    with open(output_file, 'w', encoding='utf-8') as ndjson_file:
-        for row in result_df.itertuples():
-            # Crear un diccionario para cada calle
-            housenumbers = row.housenumbers.tolist() if isinstance(row.housenumbers, np.ndarray) else row.housenumbers
-
-            street_data = {
-                "id_via": row.id_via,
-                "name": row.name,
-                "postcode": row.postcode,
-                "cod_departament": row.cod_departament,
-                "cod_province": row.cod_province,
-                "cod_district": row.cod_district,
-                "context": row.context,
-                "type": "street",
-                "housenumbers": housenumbers
-            }
-
-            # Guardar el registro directamente en el archivo
-            ndjson_line = json.dumps(street_data, ensure_ascii=False)
-            ndjson_file.write(ndjson_line + '\n')
+        # DuckDB serializa y escribe cada registro directamente en el archivo NDJSON
+        with metricas.etapa("agrupar_y_escribir") as etapa:
+            etapa["filas"] = conn.execute(f"COPY ({query}) TO '{output_file}' (FORMAT JSON)").fetchone()[0]
 
     print(f"NDJSON guardado como {output_file}")
 
 
-#info(file_path, limit)
-#find_duplicate_details(file_path, limit)
-use_duckdb_unique(file_path, postcode_file, output_file, limit)
+def diagnostico(file_path, limit, db_path, report_path, top_n=20, output_file=None):
+    """
+    Ejecuta en una sola sesión los chequeos de info, find_duplicates,
+    find_duplicate_details, get_unique_rows y find_duplicate_details_of_unique.
+
+    El parquet se lee una única vez a la tabla "fuente" de una base DuckDB persistente
+    (db_path), que queda disponible para consultas posteriores. El resultado se
+    guarda como un reporte JSON en report_path.
+
+    Si se pasa output_file (el NDJSON que generó use_duckdb_unique), se cuentan las
+    puertas (id_via, number) que aparecen más de una vez en sus housenumbers.
+    """
+    with duckdb.connect(database=db_path) as conn:
+        with metricas.etapa("leer_fuente") as etapa:
+            conn.execute("""
+                CREATE OR REPLACE TABLE fuente AS
+                SELECT id_via, numpuerta, tipo_via, nom_via, ubigeo, lon_x, lat_y
+                FROM read_parquet($file_path)
+                LIMIT $limit
+            """, {"file_path": file_path, "limit": limit})
+            etapa["filas"] = conn.execute("SELECT COUNT(*) FROM fuente").fetchone()[0]
+
+        # Grupos (id_via, numpuerta) con su cantidad de filas y de coordenadas distintas
+        conn.execute("""
+            CREATE OR REPLACE TABLE grupos AS
+            SELECT id_via, numpuerta, COUNT(*) AS count, COUNT(DISTINCT (lon_x, lat_y)) AS coordenadas_distintas
+            FROM fuente
+            GROUP BY id_via, numpuerta
+        """)
+
+        resumen = conn.execute("""
+            SELECT
+                (SELECT COUNT(*) FROM fuente) AS filas,
+                (SELECT COUNT(DISTINCT id_via) FROM fuente) AS unique_id_count,
+                COUNT(*) AS filas_unicas,
+                COUNT(*) FILTER (WHERE count > 1) AS grupos_duplicados,
+                COALESCE(SUM(count) FILTER (WHERE count > 1), 0) AS filas_duplicadas,
+                COUNT(*) FILTER (WHERE coordenadas_distintas > 1) AS duplicados_con_coordenadas_distintas
+            FROM grupos
+        """).fetchone()
+        columnas = ["filas", "unique_id_count", "filas_unicas", "grupos_duplicados",
+                    "filas_duplicadas", "duplicados_con_coordenadas_distintas"]
+        reporte = {"file_path": file_path, "limit": limit, **dict(zip(columnas, resumen))}
+
+        # Nulos en las columnas clave
+        reporte["nulos"] = dict(zip(
+            ["id_via", "numpuerta", "ubigeo", "lon_x", "lat_y"],
+            conn.execute("""
+                SELECT COUNT(*) - COUNT(id_via), COUNT(*) - COUNT(numpuerta), COUNT(*) - COUNT(ubigeo),
+                       COUNT(*) - COUNT(lon_x), COUNT(*) - COUNT(lat_y)
+                FROM fuente
+            """).fetchone()
+        ))
+
+        # Mayores infractores: puertas y calles con más filas repetidas
+        reporte["top_puertas_duplicadas"] = conn.execute("""
+            SELECT id_via, numpuerta, count, coordenadas_distintas
+            FROM grupos
+            WHERE count > 1
+            ORDER BY count DESC, id_via, numpuerta
+            LIMIT $top_n
+        """, {"top_n": top_n}).fetchdf().to_dict(orient="records")
+        reporte["top_calles_duplicadas"] = conn.execute("""
+            SELECT id_via, COUNT(*) AS puertas_duplicadas, SUM(count) - COUNT(*) AS filas_sobrantes
+            FROM grupos
+            WHERE count > 1
+            GROUP BY id_via
+            ORDER BY filas_sobrantes DESC, id_via
+            LIMIT $top_n
+        """, {"top_n": top_n}).fetchdf().to_dict(orient="records")
+
+        # use_duckdb_unique deja una fila por (id_via, numpuerta): en su salida real no
+        # deben quedar puertas repetidas, ni en una calle ni entre las partes de una calle
+        reporte["salida"] = output_file
+        reporte["duplicados_tras_unicos"] = None
+        if output_file is not None:
+            reporte["duplicados_tras_unicos"] = conn.execute("""
+                SELECT COUNT(*) FROM (
+                    SELECT id_via, casa.number
+                    FROM (SELECT id_via, unnest(housenumbers) AS casa FROM read_json($output_file, format = 'newline_delimited'))
+                    GROUP BY id_via, casa.number
+                    HAVING COUNT(*) > 1
+                )
+            """, {"output_file": output_file}).fetchone()[0]
+
+    with open(report_path, "w", encoding="utf-8") as file:
+        json.dump(reporte, file, ensure_ascii=False, indent=2, default=str)
+
+    print(f"Filas: {reporte['filas']}, IDs únicos: {reporte['unique_id_count']}, "
+          f"grupos duplicados: {reporte['grupos_duplicados']}, filas duplicadas: {reporte['filas_duplicadas']}")
+    if reporte["duplicados_tras_unicos"]:
+        print(f"⚠️ {reporte['duplicados_tras_unicos']} puertas repetidas en {output_file}")
+    print(f"Reporte de diagnóstico guardado en {report_path}")
+
+
+if __name__ == "__main__":
+    # Tiempos, filas y memoria de la corrida en metricas.jsonl
+    parametros = {"file_path": file_path, "max_casas": MAX_CASAS_POR_DOCUMENTO, "ordenar_por_numero": ORDENAR_POR_NUMERO}
+    with metricas.Ejecucion("process_streets", parametros):
+        #info(file_path, limit)
+        #find_duplicate_details(file_path, limit)
+        #diagnostico(file_path, limit, diagnostico_db, reporte_diagnostico, output_file=output_file)
+        use_duckdb_unique(file_path, postcode_file, output_file, limit)
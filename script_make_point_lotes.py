@@ -1,26 +1,41 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
 import geopandas as gpd
+import numpy as np
 import pandas as pd
-from shapely.geometry import Point, LineString, Polygon, MultiPolygon
-from shapely.ops import nearest_points
+import shapely
+from shapely import STRtree
+from shapely.geometry import LineString
 from tqdm import tqdm  # Para barra de progreso
+from escritor_geoparquet import escribir_geoparquet
+import metricas
 
-# Cargar los archivos .parquet
-lotes = gpd.read_parquet("c:/Users/jhonn/Documents/LOTES_CERCA_DE_VIAS_ULTIMO_2024.parquet")
-vias = gpd.read_parquet("c:/Users/jhonn/Documents/VIAS_LOTES_ULTIMA_2024.parquet")
-
-# Convertir geometrías a CRS métrico si es necesario
-lotes = lotes.to_crs(epsg=32718)  # Cambiar según la zona UTM correspondiente
-vias = vias.to_crs(epsg=32718)
-
-puntos_generados = []
+# Archivos de entrada y salida
+lotes_path = "c:/Users/jhonn/Documents/LOTES_CERCA_DE_VIAS_ULTIMO_2024.parquet"
+vias_path = "c:/Users/jhonn/Documents/VIAS_LOTES_ULTIMA_2024.parquet"
+output_path = "puntos_lotes.parquet"
 
 # Distancia de desplazamiento hacia el interior del lote
 DESPLAZAMIENTO = 2  # en metros
+# Distancia máxima entre un lado del lote y la vía más cercana
+MAX_DIST = 15  # en metros
+# Cantidad de polígonos que se procesan juntos en la búsqueda espacial
+TAMANO_BLOQUE = 20000
+
+# Modo de ejecución: "secuencial" o "paralelo" (teselas repartidas en un pool de procesos)
+MODO = "secuencial"
+NUM_PROCESOS = os.cpu_count()
+TAMANO_TESELA = 2000  # Lado de cada tesela de la grilla, en metros
+partes_dir = "puntos_lotes_partes"  # Carpeta donde cada proceso escribe su parte
 
 def obtener_lado_mas_cercano(poly, vias_geom, max_dist=15): #max_dist=15
+    """
+    Versión de referencia (fuerza bruta) de la búsqueda del lado más cercano.
+    Se conserva para validar obtener_lados_mas_cercanos sobre muestras pequeñas.
+    """
     lado_mas_cercano = None
     menor_distancia = float("inf")
-    
+
     for i in range(len(poly.exterior.coords) - 1):
         segmento = LineString([poly.exterior.coords[i], poly.exterior.coords[i + 1]])
         for via_geom in vias_geom:
@@ -28,46 +43,215 @@ def obtener_lado_mas_cercano(poly, vias_geom, max_dist=15): #max_dist=15
             if distancia < menor_distancia and distancia <= max_dist:
                 menor_distancia = distancia
                 lado_mas_cercano = segmento
-    
+
     return lado_mas_cercano
 
-# Iterar sobre cada lote con barra de progreso
-print("Procesando lotes...")
-for lote in tqdm(lotes.itertuples(), total=len(lotes)):
-    lote_geom = lote.geometry
-    
-    if isinstance(lote_geom, MultiPolygon):
-        lotes_polygons = list(lote_geom.geoms)  # Extraer los polígonos
-    else:
-        lotes_polygons = [lote_geom]  # Convertir a lista para tratarlo igual
-    
-    for poly in lotes_polygons:
-        vias_cercanas = [via.geometry for via in vias.itertuples()]
-        best_segment = obtener_lado_mas_cercano(poly, vias_cercanas)
-        
-        if best_segment:
-            midpoint = best_segment.interpolate(0.5, normalized=True)
-            dx, dy = best_segment.xy[0][1] - best_segment.xy[0][0], best_segment.xy[1][1] - best_segment.xy[1][0]
-            norm = (dx**2 + dy**2)**0.5
-            unit_vector = (-dy/norm, dx/norm)  # Perpendicular
-            
-            # Asegurar que el punto se aleje del borde hacia el interior del lote
-            test_point = Point(midpoint.x + unit_vector[0] * DESPLAZAMIENTO, 
-                               midpoint.y + unit_vector[1] * DESPLAZAMIENTO)
-            
-            if poly.contains(test_point):
-                puntos_generados.append(test_point)
+def obtener_lados_mas_cercanos(polys, arbol_vias, max_dist=MAX_DIST):
+    """
+    Busca el lado exterior de cada polígono más cercano a alguna vía usando un STRtree.
+
+    Solo se comparan los lados con las vías candidatas a menos de max_dist y las
+    distancias se calculan en bloque con shapely. Ante empates se elige el primer
+    lado del anillo, igual que obtener_lado_mas_cercano.
+
+    Args:
+        polys (np.ndarray): Arreglo de polígonos (sin MultiPolygon).
+        arbol_vias (STRtree): Índice espacial construido sobre las geometrías de las vías.
+        max_dist (float): Distancia máxima entre el lado y la vía.
+
+    Returns:
+        np.ndarray: Arreglo (n, 4) con x0, y0, x1, y1 del lado elegido para cada
+        polígono; NaN si no hay ninguna vía a menos de max_dist.
+    """
+    lados_elegidos = np.full((len(polys), 4), np.nan)
+
+    # Descomponer los anillos exteriores en lados (pares de vértices consecutivos)
+    anillos = shapely.get_exterior_ring(polys)
+    coords, idx_poly = shapely.get_coordinates(anillos, return_index=True)
+    mismo_anillo = idx_poly[:-1] == idx_poly[1:]
+    inicio = coords[:-1][mismo_anillo]
+    fin = coords[1:][mismo_anillo]
+    poly_de_lado = idx_poly[:-1][mismo_anillo]
+    if len(inicio) == 0:
+        return lados_elegidos
+    lados = shapely.linestrings(np.stack([inicio, fin], axis=1))
+
+    # Pares (lado, vía) a menos de max_dist y su distancia exacta
+    idx_lado, idx_via = arbol_vias.query(lados, predicate="dwithin", distance=max_dist)
+    if len(idx_lado) == 0:
+        return lados_elegidos
+    distancias = shapely.distance(lados[idx_lado], arbol_vias.geometries[idx_via])
+
+    # Por polígono: menor distancia y, en empate, el lado con menor índice
+    poly_de_par = poly_de_lado[idx_lado]
+    orden = np.lexsort((idx_lado, distancias, poly_de_par))
+    poly_ordenado = poly_de_par[orden]
+    primero = np.ones(len(orden), dtype=bool)
+    primero[1:] = poly_ordenado[1:] != poly_ordenado[:-1]
+    elegidos = idx_lado[orden][primero]
+
+    lados_elegidos[poly_de_lado[elegidos]] = np.hstack([inicio[elegidos], fin[elegidos]])
+    return lados_elegidos
+
+def calcular_puntos_desplazados(polys, lados, desplazamiento=DESPLAZAMIENTO):
+    """
+    Calcula en bloque el punto de entrada de cada polígono a partir de su lado elegido.
+
+    El punto se ubica a `desplazamiento` metros del punto medio del lado, sobre su
+    perpendicular. Si cae fuera del polígono se prueba el sentido opuesto y, si
+    tampoco queda dentro, el polígono no genera punto.
+
+    Args:
+        polys (np.ndarray): Arreglo de polígonos.
+        lados (np.ndarray): Arreglo (n, 4) de obtener_lados_mas_cercanos.
+        desplazamiento (float): Distancia hacia el interior del lote.
+
+    Returns:
+        tuple: (arreglo de puntos, arreglo con la posición en polys de cada punto).
+    """
+    posiciones = np.flatnonzero(~np.isnan(lados[:, 0]))
+    x0, y0, x1, y1 = lados[posiciones].T
+
+    # Punto medio y vector unitario perpendicular de cada lado
+    dx, dy = x1 - x0, y1 - y0
+    mx, my = x0 + 0.5 * dx, y0 + 0.5 * dy
+    norm = np.sqrt(dx**2 + dy**2)
+    ux, uy = -dy / norm, dx / norm
+
+    # Probar primero hacia un lado y, si cae fuera del lote, hacia el opuesto
+    polys_validos = polys[posiciones]
+    px, py = mx + ux * desplazamiento, my + uy * desplazamiento
+    fuera = ~shapely.contains_xy(polys_validos, px, py)
+    px[fuera] = mx[fuera] - ux[fuera] * desplazamiento
+    py[fuera] = my[fuera] - uy[fuera] * desplazamiento
+    dentro = ~fuera | shapely.contains_xy(polys_validos, px, py)
+
+    return shapely.points(px[dentro], py[dentro]), posiciones[dentro]
+
+def generar_puntos(polys, arbol_vias, barra=None):
+    """
+    Genera el punto de entrada de cada polígono, desplazado hacia su interior desde
+    el lado más cercano a una vía.
+
+    Returns:
+        tuple: (arreglo de puntos, arreglo con la posición en polys de cada punto).
+    """
+    puntos_generados = []
+    posiciones = []
+
+    for inicio_bloque in range(0, len(polys), TAMANO_BLOQUE):
+        bloque = polys[inicio_bloque:inicio_bloque + TAMANO_BLOQUE]
+        lados_bloque = obtener_lados_mas_cercanos(bloque, arbol_vias)
+        puntos_bloque, posiciones_bloque = calcular_puntos_desplazados(bloque, lados_bloque)
+        puntos_generados.append(puntos_bloque)
+        posiciones.append(posiciones_bloque + inicio_bloque)
+
+        if barra is not None:
+            barra.update(len(bloque))
+
+    if not puntos_generados:
+        return np.array([], dtype=object), np.array([], dtype=np.int64)
+    return np.concatenate(puntos_generados), np.concatenate(posiciones)
+
+def asignar_teselas(polys, tamano_tesela=TAMANO_TESELA):
+    """
+    Asigna cada polígono a una tesela de una grilla regular según el centro de su
+    envolvente. Las teselas se numeran de 0 a n-1 en orden (columna, fila).
+    """
+    bounds = shapely.bounds(polys)
+    col = np.floor((bounds[:, 0] + bounds[:, 2]) / 2 / tamano_tesela).astype(np.int64)
+    fila = np.floor((bounds[:, 1] + bounds[:, 3]) / 2 / tamano_tesela).astype(np.int64)
+    _, teselas = np.unique(np.stack([col, fila], axis=1), axis=0, return_inverse=True)
+    return teselas.ravel()
+
+def procesar_tesela(id_tesela, polys, orden, vias_geom, crs, partes_dir):
+    """
+    Procesa una tesela en un proceso del pool y escribe su parte en GeoParquet.
+    La columna "orden" guarda la posición global de cada polígono para la unión final.
+    """
+    arbol_vias = STRtree(vias_geom)
+    puntos, posiciones = generar_puntos(polys, arbol_vias)
+    ruta_parte = os.path.join(partes_dir, f"parte_{id_tesela:06d}.parquet")
+    gpd.GeoDataFrame({"orden": orden[posiciones]}, geometry=puntos, crs=crs).to_parquet(ruta_parte)
+    return ruta_parte
+
+def ejecutar_paralelo(polys, vias_geom, crs, num_procesos=NUM_PROCESOS):
+    """
+    Reparte los polígonos en teselas y las procesa en un pool de procesos. Cada tesela
+    recibe solo las vías que intersecan su envolvente ampliada en MAX_DIST.
+    Las partes se unen al final en el mismo orden que el modo secuencial.
+
+    Returns:
+        tuple: (arreglo de puntos, arreglo con la posición en polys de cada punto).
+    """
+    teselas = asignar_teselas(polys)
+    orden_teselas = np.argsort(teselas, kind="stable")
+    cortes = np.cumsum(np.bincount(teselas))[:-1]
+    arbol_vias = STRtree(vias_geom)
+    os.makedirs(partes_dir, exist_ok=True)
+
+    print(f"Procesando {len(cortes) + 1} teselas con {num_procesos} procesos...")
+    with ProcessPoolExecutor(max_workers=num_procesos) as pool:
+        futuros = []
+        for id_tesela, orden in enumerate(np.split(orden_teselas, cortes)):
+            polys_tesela = polys[orden]
+            xmin, ymin, xmax, ymax = shapely.total_bounds(polys_tesela)
+            idx_vias = arbol_vias.query(shapely.box(xmin - MAX_DIST, ymin - MAX_DIST, xmax + MAX_DIST, ymax + MAX_DIST))
+            if len(idx_vias) == 0:
+                continue
+            futuros.append(pool.submit(procesar_tesela, id_tesela, polys_tesela, orden,
+                                       arbol_vias.geometries[np.sort(idx_vias)], crs, partes_dir))
+        rutas_partes = [futuro.result() for futuro in tqdm(futuros, desc="Teselas")]
+
+    # Unir las partes respetando el orden original de los polígonos
+    print("Uniendo partes...")
+    partes = [gpd.read_parquet(ruta) for ruta in rutas_partes]
+    if not partes:
+        return np.array([], dtype=object), np.array([], dtype=np.int64)
+    puntos_gdf = pd.concat(partes, ignore_index=True).sort_values("orden", kind="stable")
+    return puntos_gdf.geometry.values.to_numpy(), puntos_gdf["orden"].to_numpy()
+
+if __name__ == "__main__":
+    # Tiempos, filas y memoria de la corrida en metricas.jsonl
+    parametros = {"lotes_path": lotes_path, "vias_path": vias_path, "modo": MODO, "max_dist": MAX_DIST,
+                  "tamano_bloque": TAMANO_BLOQUE, "num_procesos": NUM_PROCESOS}
+    with metricas.Ejecucion("script_make_point_lotes", parametros):
+        # Cargar los archivos .parquet
+        with metricas.etapa("leer") as etapa:
+            lotes = gpd.read_parquet(lotes_path)
+            vias = gpd.read_parquet(vias_path)
+            etapa["filas"] = len(lotes)
+            etapa["vias"] = len(vias)
+
+        # Convertir geometrías a CRS métrico si es necesario
+        with metricas.etapa("reproyectar", filas=len(lotes) + len(vias)):
+            lotes = lotes.to_crs(epsg=32718)  # Cambiar según la zona UTM correspondiente
+            vias = vias.to_crs(epsg=32718)
+
+        # Separar los MultiPolygon en sus polígonos, conservando el orden de los lotes
+        lotes_polygons, idx_lote = shapely.get_parts(lotes.geometry.values, return_index=True)
+
+        with metricas.etapa("generar_puntos", filas=len(lotes_polygons)) as etapa:
+            if MODO == "paralelo":
+                puntos_generados, posiciones = ejecutar_paralelo(lotes_polygons, vias.geometry.values, lotes.crs)
             else:
-                # Si el punto cae fuera, invertir la dirección del desplazamiento
-                new_point = Point(midpoint.x - unit_vector[0] * DESPLAZAMIENTO, 
-                                  midpoint.y - unit_vector[1] * DESPLAZAMIENTO)
-                if poly.contains(new_point):
-                    puntos_generados.append(new_point)
+                # Índice espacial sobre las vías (se construye una sola vez)
+                print("Construyendo índice espacial de vías...")
+                arbol_vias = STRtree(vias.geometry.values)
+
+                # Iterar sobre los polígonos por bloques con barra de progreso
+                print("Procesando lotes...")
+                with tqdm(total=len(lotes_polygons)) as barra:
+                    puntos_generados, posiciones = generar_puntos(lotes_polygons, arbol_vias, barra)
+            etapa["puntos"] = len(puntos_generados)
 
-# Crear un GeoDataFrame con los puntos generados
-puntos_gdf = gpd.GeoDataFrame(geometry=puntos_generados, crs=lotes.crs)
+        # Crear un GeoDataFrame con los puntos generados y los atributos de su lote
+        atributos = pd.DataFrame(lotes.drop(columns=lotes.geometry.name)).iloc[idx_lote[posiciones]]
+        atributos.insert(0, "indice_lote", atributos.index)
+        puntos_gdf = gpd.GeoDataFrame(atributos.reset_index(drop=True), geometry=puntos_generados, crs=lotes.crs)
 
-# Guardar en un archivo .parquet
-puntos_gdf.to_parquet("puntos_lotes.parquet")
+        # Guardar en un archivo .parquet (ordenado por Hilbert y con columna bbox)
+        with metricas.etapa("escribir", filas=len(puntos_gdf)):
+            escribir_geoparquet(puntos_gdf, output_path)
 
-print("Procesamiento completado. Archivo guardado: puntos_lotes.parquet")
\ No newline at end of file
+    print(f"Procesamiento completado. Archivo guardado: {output_path}")
@@ -51,20 +51,45 @@
 
 # print(f"Archivo guardado en: {output_path}")
 
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import chain, repeat
 import geopandas as gpd
 import h3
+import numpy as np
 import pandas as pd
+import shapely
 from shapely.geometry import Polygon, MultiPolygon
+from escritor_geoparquet import escribir_geoparquet, escribir_geoparquet_particionado
+import metricas
 
 # Cargar el archivo Shapefile desde el ZIP
 file_path = "zip://c:/Users/jhonn/Documents/Capa_Demografica.zip"
 output_path = "Capa_Demografica_indexado_con_hexagono.parquet"
-gdf = gpd.read_file(file_path)
 resolution=8
+
+# Modo de salida: "archivo" (un solo parquet) o "particionado" (dataset hive por celda H3 padre)
+MODO_SALIDA = "archivo"
+RESOLUCION_PARTICION = 4  # Resolución de la celda padre que define cada partición
+output_dir = "Capa_Demografica_indexado_con_hexagono"  # Carpeta del dataset particionado
+
+# Modo de indexación:
+# - "centroide": celda del centroide de cada polígono y su hexágono como geometría.
+# - "cobertura": además, las celdas que cubren cada polígono compactadas en varias
+#   resoluciones (columna h3_cobertura, lista de enteros); se conserva la geometría original.
+MODO_INDEXACION = "centroide"
+
+# Cálculo de celdas en un pool de procesos para capas grandes
+NUM_PROCESOS = os.cpu_count()
+TAMANO_BLOQUE = 200000  # Centroides por tarea; con menos centroides no se usa el pool
+TAMANO_BLOQUE_COBERTURA = 500  # Polígonos por tarea en modo cobertura
+
 # Función para convertir geometría a H3 y devolver el hexágono
 def geometry_to_h3(geometry):
     """
     Convierte una geometría en un índice H3 y su geometría hexagonal.
+    Versión de referencia (fila por fila); se conserva para validar indexar_geometrias.
     """
     if geometry.geom_type == "Point":
         h3_index = h3.latlng_to_cell(geometry.y, geometry.x, resolution)
@@ -97,24 +122,175 @@ def geometry_to_h3(geometry):
     else:
         raise ValueError(f"Tipo de geometría no soportado: {geometry.geom_type}")
 
-# Aplicamos la conversión
-print(f'Indexando: {gdf.geometry.geom_type[0]}...')
-h3_results = gdf.geometry.apply(geometry_to_h3)
+def celdas_de_puntos(lats, lngs, resolucion):
+    """Celda H3 de cada punto (se ejecuta en los procesos del pool)."""
+    return [h3.latlng_to_cell(lat, lng, resolucion) for lat, lng in zip(lats, lngs)]
+
+def calcular_celdas(lats, lngs, resolucion, num_procesos=NUM_PROCESOS, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Celda H3 de cada punto. Si hay más de tamano_bloque puntos, los bloques se reparten
+    en un pool de procesos; el resultado conserva el orden de los puntos.
+    """
+    if len(lats) <= tamano_bloque or num_procesos <= 1:
+        return np.array(celdas_de_puntos(lats, lngs, resolucion), dtype=object)
+
+    inicios = range(0, len(lats), tamano_bloque)
+    with ProcessPoolExecutor(max_workers=num_procesos) as pool:
+        resultados = pool.map(
+            celdas_de_puntos,
+            (lats[i:i + tamano_bloque] for i in inicios),
+            (lngs[i:i + tamano_bloque] for i in inicios),
+            repeat(resolucion),
+        )
+        return np.array(list(chain.from_iterable(resultados)), dtype=object)
+
+@lru_cache(maxsize=None)
+def hexagono_de_celda(celda):
+    """Hexágono de una celda H3; se construye una sola vez por celda."""
+    hex_coords = [[lng, lat] for lat, lng in h3.cell_to_boundary(celda)]
+    hex_coords.append(hex_coords[0])  # Cerrar polígono
+    return Polygon(hex_coords)
+
+def indexar_geometrias(geometrias, resolucion):
+    """
+    Indexa en bloque un arreglo de geometrías con el mismo resultado que geometry_to_h3.
+
+    Los centroides (uno por Point o Polygon, uno por parte en los MultiPolygon) se
+    calculan juntos con shapely, las celdas se obtienen en bloque y cada hexágono se
+    construye una sola vez por celda distinta antes de asignarlo a sus filas.
+
+    Args:
+        geometrias (np.ndarray): Arreglo de Point, Polygon o MultiPolygon.
+        resolucion (int): Resolución H3.
+
+    Returns:
+        tuple: (h3_index por fila, hexágonos por fila, celda principal por fila). En los
+        MultiPolygon h3_index es la lista de celdas como texto, el hexágono un
+        MultiPolygon y la celda principal la de la primera parte.
+    """
+    geometrias = np.asarray(geometrias, dtype=object)
+    tipos = shapely.get_type_id(geometrias)
+    no_soportados = ~np.isin(tipos, [0, 3, 6])  # Point, Polygon, MultiPolygon
+    if no_soportados.any():
+        raise ValueError(f"Tipo de geometría no soportado: {geometrias[no_soportados][0].geom_type}")
+
+    # Centroide de cada parte y su celda
+    partes, idx_geometria = shapely.get_parts(geometrias, return_index=True)
+    centroides = shapely.centroid(partes)
+    celdas = calcular_celdas(shapely.get_y(centroides), shapely.get_x(centroides), resolucion)
+
+    # Un hexágono por celda distinta, asignado luego a cada parte
+    unicas, inversa = np.unique(celdas, return_inverse=True)
+    hexagonos_unicos = np.empty(len(unicas), dtype=object)
+    hexagonos_unicos[:] = [hexagono_de_celda(celda) for celda in unicas]
+    hexagonos_partes = hexagonos_unicos[inversa]
+
+    # Valores por fila a partir de su primera parte
+    primeras = np.searchsorted(idx_geometria, np.arange(len(geometrias)))
+    h3_index = celdas[primeras]
+    hexagonos = hexagonos_partes[primeras]
+    celda_principal = celdas[primeras]
+
+    # Los MultiPolygon llevan la lista de celdas y el MultiPolygon de sus hexágonos
+    es_multi = tipos[idx_geometria] == 6
+    if es_multi.any():
+        filas_multi, indices_multi = np.unique(idx_geometria[es_multi], return_inverse=True)
+        hexagonos[filas_multi] = shapely.multipolygons(hexagonos_partes[es_multi], indices=indices_multi)
+        cortes = np.cumsum(np.bincount(indices_multi))[:-1]
+        h3_index[filas_multi] = [str(list(grupo)) for grupo in np.split(celdas[es_multi], cortes)]
+
+    return h3_index, hexagonos, celda_principal
+
+def cobertura_de_geometrias(geometrias, resolucion):
+    """
+    Celdas compactadas que cubren cada geometría, como enteros ordenados (se ejecuta en
+    los procesos del pool). Los polígonos que no contienen el centro de ninguna celda
+    quedan con la celda de su centroide, y los puntos con su propia celda.
+    """
+    coberturas = []
+    for geometria in geometrias:
+        if geometria.geom_type == "Point":
+            celdas = [h3.latlng_to_cell(geometria.y, geometria.x, resolucion)]
+        else:
+            celdas = h3.geo_to_cells(geometria, resolucion)
+            if not celdas:
+                centroide = geometria.centroid
+                celdas = [h3.latlng_to_cell(centroide.y, centroide.x, resolucion)]
+        coberturas.append(sorted(h3.str_to_int(celda) for celda in h3.compact_cells(celdas)))
+    return coberturas
+
+def calcular_coberturas(geometrias, resolucion, num_procesos=NUM_PROCESOS, tamano_bloque=TAMANO_BLOQUE_COBERTURA):
+    """
+    Cobertura H3 compactada de cada geometría. Si hay más de tamano_bloque geometrías,
+    los bloques se reparten en un pool de procesos; el resultado conserva el orden.
+    """
+    if len(geometrias) <= tamano_bloque or num_procesos <= 1:
+        return cobertura_de_geometrias(geometrias, resolucion)
+
+    inicios = range(0, len(geometrias), tamano_bloque)
+    with ProcessPoolExecutor(max_workers=num_procesos) as pool:
+        resultados = pool.map(
+            cobertura_de_geometrias,
+            (geometrias[i:i + tamano_bloque] for i in inicios),
+            repeat(resolucion),
+        )
+        return list(chain.from_iterable(resultados))
+
+if __name__ == "__main__":
+    # Tiempos, filas y memoria de la corrida en metricas.jsonl
+    parametros = {"file_path": file_path, "resolucion": resolution, "modo_indexacion": MODO_INDEXACION,
+                  "modo_salida": MODO_SALIDA, "num_procesos": NUM_PROCESOS}
+    with metricas.Ejecucion("script_shapefile_to_h3", parametros):
+        with metricas.etapa("leer") as etapa:
+            gdf = gpd.read_file(file_path)
+            etapa["filas"] = len(gdf)
+
+        # Aplicamos la conversión
+        print(f'Indexando: {gdf.geometry.geom_type[0]}...')
+        with metricas.etapa("indexar", filas=len(gdf)):
+            h3_index, hexagonos, celda_principal = indexar_geometrias(gdf.geometry.values, resolution)
+
+        # Guardamos el índice H3 de cada fila
+        gdf['h3_index'] = h3_index
+        if MODO_INDEXACION == "cobertura":
+            # Celdas compactadas que cubren cada polígono; la geometría original se conserva
+            print('Calculando coberturas...')
+            with metricas.etapa("cobertura", filas=len(gdf)):
+                gdf['h3_cobertura'] = pd.Series(calcular_coberturas(gdf.geometry.values, resolution), index=gdf.index)
+        else:
+            # Guardamos la geometría del hexágono
+            gdf['geometry'] = hexagonos
 
-# Extraemos el índice H3 y la geometría generada
-gdf['h3_index'] = h3_results.apply(lambda x: str(x[0]) if isinstance(x[0], list) else x[0])
-gdf['geometry'] = h3_results.apply(lambda x: x[1])  # Guardamos la geometría del hexágono
+        # Convertimos a GeoDataFrame con las geometrías hexagonales
+        print('Estableciendo CRS a EPSG:4326')
+        df = gpd.GeoDataFrame(gdf, crs="EPSG:4326")
 
-# Convertimos a GeoDataFrame con las geometrías hexagonales
-print('Estableciendo CRS a EPSG:4326')
-df = gpd.GeoDataFrame(gdf, crs="EPSG:4326")
+        # Establecer CRS si no está definido
+        if df.crs is None:
+            df.crs = 'EPSG:4326'
 
-# Establecer CRS si no está definido
-if df.crs is None:
-    df.crs = 'EPSG:4326'
+        # Celda de cada fila (la de la primera parte en los MultiPolygon, cuyo h3_index es
+        # una lista como texto): clave de orden y de partición
+        df["h3_principal"] = celda_principal
 
-# Guardar en Parquet
-df.to_parquet(output_path, engine="pyarrow")
+        with metricas.etapa("escribir", filas=len(df)):
+            if MODO_SALIDA == "particionado":
+                # Partición por la celda padre de la celda principal, calculada una vez por celda distinta
+                unicas, inversa = np.unique(celda_principal, return_inverse=True)
+                padres = np.array([h3.cell_to_parent(celda, RESOLUCION_PARTICION) for celda in unicas], dtype=object)
+                df["h3_parent"] = padres[inversa]
 
-print(f"Archivo guardado en: {output_path}")
+                # Solo se reescriben las particiones presentes en esta capa; el resto del dataset se conserva
+                manifiesto = escribir_geoparquet_particionado(
+                    df, output_dir, "h3_parent", orden="h3", columna_h3="h3_principal",
+                    metadatos={
+                        "resolucion": resolution, "resolucion_particion": RESOLUCION_PARTICION,
+                        "modo_indexacion": MODO_INDEXACION,
+                    }
+                )
+                print(f"Dataset guardado en: {output_dir} ({len(manifiesto['particiones'])} particiones, {manifiesto['total_filas']} filas)")
+            else:
+                # Guardar en Parquet, ordenado por celda H3 y con columna bbox
+                escribir_geoparquet(df, output_path, orden="h3", columna_h3="h3_principal")
 
+                print(f"Archivo guardado en: {output_path}")
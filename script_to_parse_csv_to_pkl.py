@@ -1,36 +1,37 @@
 import pandas as pd
 import os
-import pickle
+import ubigeo
 
 # Ruta del archivo en Windows
 csv_file = r"C:\Users\jhonn\Desktop\proyectos\script_para_procesar_data_elastic\UBIGEOS_2022_1891_distritos.csv"
-pkl_file = "ubigeo_dict.pkl"
-# Verificar si el archivo existe
-if os.path.exists(csv_file):
-    print("Archivo encontrado, procesando...")
-    
-    # Leer el archivo CSV
-try:
-    df = pd.read_csv(csv_file, delimiter=';')
-    print("Archivo encontrado, procesando...")
+pkl_file = "ubigeo_dict.pkl"  # Diccionario anterior; se usa si no está el CSV
+arrow_file = ubigeo.ubigeo_file  # Tabla que usan los demás scripts
 
-    # Renombrar columnas para estandarizar con los nombres esperados
-    df.rename(columns={
+def leer_csv(csv_file):
+    """Lee el CSV de ubigeos del INEI y estandariza los nombres de columnas."""
+    df = pd.read_csv(csv_file, delimiter=';')
+    return df.rename(columns={
         "ubigeo": "postcode",
         "NOMBDEP": "cod_departament",
         "NOMBPROV": "cod_province",
         "NOMBDIST": "cod_district",
         "REGION NATURAL": "context"
-    }, inplace=True)
+    })
 
-    # Convertir DataFrame a diccionario con el formato adecuado
-    ubigeo_dict = df[["postcode", "cod_departament", "cod_province", "cod_district", "context"]].set_index("postcode").T.to_dict()
+def leer_pkl(pkl_file):
+    """Convierte el diccionario postcode -> {cod_departament, ...} a un DataFrame."""
+    ubigeo_dict = pd.read_pickle(pkl_file)
+    return pd.DataFrame.from_dict(ubigeo_dict, orient="index").rename_axis("postcode").reset_index()
 
-    # Guardar el diccionario en formato PKL
-    pd.to_pickle(ubigeo_dict, pkl_file)
-    print(f"Archivo {pkl_file} generado correctamente.")
-
-except Exception as e:
-    print(f"Error al procesar el archivo: {e}")
+# Verificar si el archivo existe
+if os.path.exists(csv_file):
+    print("Archivo encontrado, procesando...")
+    df = leer_csv(csv_file)
+elif os.path.exists(pkl_file):
+    print(f"CSV no encontrado, usando {pkl_file}...")
+    df = leer_pkl(pkl_file)
 else:
-    print("Archivo no encontrado. Verifica la ruta.")
+    raise FileNotFoundError("Archivo no encontrado. Verifica la ruta.")
+
+# Guardar la tabla en Arrow IPC
+ubigeo.construir_tabla(df[["postcode"] + ubigeo.COLUMNAS], arrow_file)
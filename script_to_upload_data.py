@@ -1,8 +1,13 @@
-from elasticsearch import Elasticsearch, helpers
+from elasticsearch import Elasticsearch, TransportError, helpers
 import json
+import hashlib
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm  # Barra de progreso
 from dotenv import load_dotenv
 import os
+import metricas
 
 load_dotenv()
 # Configuración de Elasticsearch
@@ -13,7 +18,40 @@ es = Elasticsearch(
 
 index_name = "calles_numero_de_puerta"  # Nombre del índice donde se cargarán los datos
 file_path = "ndjson/manzanas_trujillo.ndjson"  # Ruta al archivo NDJSON a cargar
-mapping_path = "mapping/calles.json"  # Ruta al archivo JSON del mapeo
+# Todos los NDJSON que forman el índice: el modo reconstrucción los carga juntos en el índice nuevo
+archivos_indice = ["ndjson/calles.ndjson", file_path]
+
+# Perfil de mapeo del índice:
+# - "estandar": textos con subcampo keyword y ubicación como dos float (lat, lon).
+# - "geo": housenumbers.location como geo_point (consultas geo_distance / geo_bounding_box),
+#   códigos (postcode, cod_*) solo keyword, sin norms donde no se usan y compresión alta.
+PERFIL_MAPEO = "estandar"
+MAPEOS = {
+    "estandar": "mapping/calles.json",
+    "geo": "mapping/calles_geo.json",
+}
+mapping_path = MAPEOS[PERFIL_MAPEO]  # Ruta al archivo JSON del mapeo
+
+# Modo de carga: "secuencial" (un bulk a la vez), "paralelo" (varios bulk en vuelo)
+# "incremental" (paralelo, enviando solo documentos nuevos/modificados y borrando los del mismo archivo que ya no están)
+# o "reconstruccion" (carga archivos_indice en un índice versionado nuevo y luego mueve el alias index_name hacia él)
+MODO_CARGA = "paralelo"
+NUM_HILOS = 4  # Peticiones bulk simultáneas en el modo paralelo
+CHUNK_SIZE = 1000  # Máximo de documentos por petición bulk
+MAX_CHUNK_BYTES = 10 * 1024 * 1024  # Máximo de bytes por petición bulk
+
+# Reanudación y reintentos del modo paralelo
+checkpoint_path = f"{file_path}.checkpoint"  # Último offset (bytes) confirmado y tamaño del dead-letter en ese punto
+dead_letter_path = f"{file_path}.rechazados.ndjson"  # Documentos rechazados definitivamente
+MAX_REINTENTOS = 5
+BACKOFF_INICIAL = 2  # Segundos de espera antes del primer reintento
+BACKOFF_MAXIMO = 60  # Tope de la espera entre reintentos
+CODIGOS_REINTENTABLES = {429, 500, 502, 503, 504}
+
+# Configuración del índice durante la carga en modo reconstrucción
+CONFIG_CARGA = {"refresh_interval": "-1", "number_of_replicas": 0}
+# Si index_name existe como índice (no como alias), se elimina al mover el alias
+REEMPLAZAR_INDICE_CONCRETO = False
 
 def read_mapping(file_path):
     """Lee el archivo de mapeo JSON y lo convierte a un diccionario."""
@@ -63,11 +101,395 @@ def bulk_load_to_elasticsearch(es, index_name, file_path, chunk_size=1000):
                 print(f"Error durante la carga en Elasticsearch: {e}")
     print("Datos cargados correctamente.")
 
-# Leer el mapeo del archivo JSON
-mapping = read_mapping(mapping_path)
+def leer_checkpoint(checkpoint_path, file_path):
+    """
+    Devuelve (offset, tamaño del dead-letter) guardados en el checkpoint, o (0, None) si
+    no existe o es de otro archivo.
+    """
+    if not os.path.exists(checkpoint_path):
+        return 0, None
+    with open(checkpoint_path, "r", encoding="utf-8") as file:
+        checkpoint = json.load(file)
+    if checkpoint.get("file_path") != file_path or checkpoint.get("size") != os.path.getsize(file_path):
+        print(f"⚠️ El checkpoint {checkpoint_path} no corresponde al archivo actual. Se carga desde el inicio.")
+        return 0, None
+    return checkpoint["offset"], checkpoint.get("dead_letter_size")
+
+def guardar_checkpoint(checkpoint_path, file_path, offset, dead_letter_size):
+    """Guarda el offset confirmado y el tamaño del dead-letter reemplazando el archivo de forma atómica."""
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump({"file_path": file_path, "size": os.path.getsize(file_path), "offset": offset,
+                   "dead_letter_size": dead_letter_size}, file)
+    os.replace(tmp_path, checkpoint_path)
+
+def generar_id(documento):
+    """
+    Genera un _id estable a partir de id_via, postcode y context. Los documentos sin
+    id_via (manzanas) agregan name para no mezclar urbanizaciones del mismo distrito.
+    Las partes de una calle dividida (campo part) agregan su número de parte; su
+    parent_id es el _id que tendría la calle sin dividir.
+    """
+    partes = [documento.get("id_via"), documento.get("postcode"), documento.get("context")]
+    if documento.get("id_via") is None:
+        partes.append(documento.get("name"))
+    if documento.get("part") is not None:
+        partes.append(documento["part"])
+    clave = "|".join("" if parte is None else str(parte) for parte in partes)
+    return hashlib.sha1(clave.encode("utf-8")).hexdigest()
+
+def calcular_hash(documento):
+    """
+    Hash del contenido del documento (sin content_hash), independiente del orden de las
+    claves y del orden de housenumbers: las mismas puertas dan el mismo hash.
+    """
+    contenido = {k: v for k, v in documento.items() if k != "content_hash"}
+    if isinstance(contenido.get("housenumbers"), list):
+        contenido["housenumbers"] = sorted(
+            contenido["housenumbers"], key=lambda casa: json.dumps(casa, sort_keys=True, ensure_ascii=False)
+        )
+    return hashlib.sha1(json.dumps(contenido, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def obtener_hashes_indexados(es, index_name, origen):
+    """
+    Devuelve un diccionario {_id: content_hash} con los documentos del índice cargados
+    desde el archivo origen (campo origen). Los de otros archivos del mismo índice no
+    se incluyen, así que la carga incremental de un archivo nunca los borra.
+    """
+    if not es.indices.exists(index=index_name):
+        return {}
+    return {
+        hit["_id"]: (hit.get("_source") or {}).get("content_hash")
+        for hit in helpers.scan(es, index=index_name, query={"query": {"term": {"origen": origen}}}, _source=["content_hash"])
+    }
+
+def leer_lotes(index_name, file_path, chunk_size=CHUNK_SIZE, max_chunk_bytes=MAX_CHUNK_BYTES, offset_inicial=0,
+               hashes_indexados=None, delta=None, origen=None):
+    """
+    Lee el NDJSON en una sola pasada desde offset_inicial y genera lotes de acciones
+    limitados por cantidad de documentos y por bytes. Cada lote se entrega junto con
+    el offset (en bytes) del archivo hasta donde llega y los registros para el
+    dead-letter (líneas inválidas y claves duplicadas) de ese tramo, que se escriben
+    al confirmar el lote para que el checkpoint cubra también el dead-letter.
+
+    Cada documento lleva un _id estable (generar_id): reenviar un lote tras un error
+    de conexión o al reanudar sobrescribe los documentos en lugar de duplicarlos.
+    Si se pasa origen, se guarda en el campo origen de cada documento.
+
+    Si se pasa hashes_indexados ({_id: content_hash}, modo incremental), cada documento
+    lleva además content_hash y solo se envían los nuevos o modificados. Los _id
+    encontrados se quitan del diccionario: al terminar quedan los que hay que borrar.
+    delta acumula los conteos de nuevos, modificados y sin cambios.
+    """
+    vistos = set()
+    acciones = []
+    rechazos = []
+    bytes_lote = 0
+    offset = offset_inicial
+    with open(file_path, "rb") as file:
+        file.seek(offset_inicial)
+        for line in file:
+            offset += len(line)
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Línea inválida encontrada: {line}. Error: {e}")
+                rechazos.append({"linea": line.decode("utf-8", "replace"), "error": str(e)})
+                continue
+            _id = generar_id(data)
+            if _id in vistos:
+                print(f"Clave duplicada en el archivo: {line[:200]}")
+                rechazos.append({"documento": data, "error": "Clave duplicada (id_via, postcode, context, part)"})
+                continue
+            vistos.add(_id)
+            if origen is not None:
+                data["origen"] = origen
+            accion = {"_index": index_name, "_id": _id, "_source": data}
+            if hashes_indexados is not None:
+                data["content_hash"] = calcular_hash(data)
+                existia = _id in hashes_indexados
+                if existia and hashes_indexados.pop(_id) == data["content_hash"]:
+                    delta["sin_cambios"] += 1
+                    continue
+                delta["modificados" if existia else "nuevos"] += 1
+            acciones.append(accion)
+            bytes_lote += len(line)
+            if len(acciones) >= chunk_size or bytes_lote >= max_chunk_bytes:
+                yield acciones, offset, rechazos
+                acciones = []
+                rechazos = []
+                bytes_lote = 0
+    if acciones or rechazos or offset > offset_inicial:
+        yield acciones, offset, rechazos
+
+def enviar_lote(es, acciones, max_chunk_bytes=MAX_CHUNK_BYTES, max_reintentos=MAX_REINTENTOS):
+    """
+    Envía un lote con streaming_bulk. Los documentos rechazados con 429/5xx, y el lote
+    completo si falla la conexión, se reintentan con backoff exponencial.
+
+    Returns:
+        tuple: (documentos indexados, lista de (acción, error) rechazados definitivamente).
+    """
+    exitos = 0
+    rechazados = []
+    if not acciones:
+        return exitos, rechazados
+    pendientes = acciones
+    for intento in range(max_reintentos + 1):
+        if intento:
+            time.sleep(min(BACKOFF_INICIAL * 2 ** (intento - 1), BACKOFF_MAXIMO))
+
+        reintentar = []
+        procesados = 0
+        try:
+            for ok, info in helpers.streaming_bulk(
+                es, pendientes, chunk_size=len(pendientes), max_chunk_bytes=max_chunk_bytes,
+                raise_on_error=False, raise_on_exception=False
+            ):
+                accion = pendientes[procesados]
+                procesados += 1
+                error = next(iter(info.values()))
+                # Borrar un documento que ya no existe no es un error
+                if ok or (accion.get("_op_type") == "delete" and error.get("status") == 404):
+                    exitos += 1
+                    continue
+                if error.get("status") in CODIGOS_REINTENTABLES:
+                    reintentar.append((accion, error))
+                else:
+                    rechazados.append((accion, error))
+        except TransportError as e:
+            # Error de conexión o timeout: se reintenta todo lo que no llegó a confirmarse
+            # (con el mismo _id, si Elasticsearch ya lo había aplicado se sobrescribe)
+            reintentar.extend((accion, {"error": str(e), "status": None}) for accion in pendientes[procesados:])
+
+        if not reintentar:
+            break
+        if intento == max_reintentos:
+            rechazados.extend(reintentar)
+            break
+        print(f"Reintentando {len(reintentar)} documentos (intento {intento + 1} de {max_reintentos})...")
+        pendientes = [accion for accion, _ in reintentar]
+
+    return exitos, rechazados
+
+def confirmar_lote(pendientes, barra, resumen, dead_letter, checkpoint_path, file_path):
+    """
+    Espera el lote más antiguo en vuelo, manda al dead-letter sus líneas inválidas y
+    sus rechazos y guarda el checkpoint con el offset hasta donde llega y el tamaño
+    del dead-letter (si checkpoint_path no es None).
+    """
+    futuro, offset, rechazos_lectura = pendientes.popleft()
+    exitos, rechazados = futuro.result()
+    resumen["exitos"] += exitos
+    resumen["fallidos"] += len(rechazos_lectura) + len(rechazados)
+    for rechazo in rechazos_lectura:
+        dead_letter.write(json.dumps(rechazo, ensure_ascii=False, default=str) + "\n")
+    for accion, error in rechazados:
+        error = {k: v for k, v in error.items() if k not in ("data", "exception")}
+        rechazo = {"documento": accion.get("_source"), "error": error}
+        if "_id" in accion:
+            rechazo["_id"] = accion["_id"]
+        dead_letter.write(json.dumps(rechazo, ensure_ascii=False, default=str) + "\n")
+    # El dead-letter se persiste antes de avanzar el checkpoint
+    dead_letter.flush()
+    if checkpoint_path is not None:
+        guardar_checkpoint(checkpoint_path, file_path, offset, os.fstat(dead_letter.fileno()).st_size)
+    barra.update(offset - resumen["offset"])
+    resumen["offset"] = offset
+
+def bulk_load_parallel(es, index_name, file_path, num_hilos=NUM_HILOS, chunk_size=CHUNK_SIZE, max_chunk_bytes=MAX_CHUNK_BYTES,
+                       checkpoint_path=checkpoint_path, dead_letter_path=dead_letter_path, incremental=False, origen=None):
+    """
+    Carga datos en Elasticsearch con varias peticiones bulk en vuelo a la vez.
+
+    El archivo se lee una sola vez: la barra de progreso avanza según el offset en
+    bytes del último lote confirmado. Los lotes se confirman en orden y como máximo
+    hay 2 * num_hilos lotes en memoria.
+
+    Tras cada lote confirmado se guarda su offset en checkpoint_path; si la carga se
+    interrumpe, la siguiente ejecución continúa desde ahí. Los documentos rechazados
+    (y las líneas inválidas) se escriben en dead_letter_path en lugar de abortar.
+    Los lotes en vuelo al interrumpirse se reenvían al reanudar; como cada documento
+    tiene un _id estable se sobrescriben, y el dead-letter se recorta al tamaño que
+    tenía en el checkpoint para no repetir sus registros. Una carga que no reanuda
+    empieza con el dead-letter vacío, así solo contiene los rechazos de esa carga.
+
+    Cada documento guarda en el campo origen el archivo del que viene (por defecto el
+    nombre de file_path), porque varios NDJSON (calles y manzanas) comparten el índice.
+
+    Con incremental=True los documentos llevan además un content_hash: solo se envían
+    los nuevos o modificados y al final se borran los del mismo origen que ya no están
+    en el archivo. En este modo no se usa checkpoint: al relanzar, lo ya cargado
+    coincide con su hash y se omite.
+
+    Returns:
+        dict: documentos enviados, exitos, fallidos (rechazados, líneas inválidas y
+        claves duplicadas) y offset final.
+    """
+    if origen is None:
+        origen = os.path.basename(file_path)
+    pendientes = deque()
+    hashes_indexados = None
+    delta = {"nuevos": 0, "modificados": 0, "sin_cambios": 0, "eliminados": 0}
+    offset_inicial = 0
+    if incremental:
+        print("Leyendo los hashes de los documentos indexados...")
+        with metricas.etapa("leer_hashes") as etapa:
+            hashes_indexados = obtener_hashes_indexados(es, index_name, origen)
+            etapa["filas"] = len(hashes_indexados)
+        checkpoint_path = None
+    elif checkpoint_path is not None:
+        offset_inicial, dead_letter_size = leer_checkpoint(checkpoint_path, file_path)
+        if offset_inicial:
+            print(f"Reanudando la carga desde el byte {offset_inicial}.")
+            # Lo escrito en el dead-letter después del checkpoint se vuelve a generar
+            if dead_letter_size is not None and os.path.exists(dead_letter_path) and os.path.getsize(dead_letter_path) > dead_letter_size:
+                os.truncate(dead_letter_path, dead_letter_size)
+    resumen = {"documentos": 0, "exitos": 0, "fallidos": 0, "offset": offset_inicial}
+
+    # Al reanudar se agrega al dead-letter de la carga interrumpida; si no, se vacía
+    modo_dead_letter = "a" if offset_inicial else "w"
+    with open(dead_letter_path, modo_dead_letter, encoding="utf-8") as dead_letter, ThreadPoolExecutor(max_workers=num_hilos) as pool, tqdm(
+        total=os.path.getsize(file_path), initial=offset_inicial, unit="B", unit_scale=True, desc="Cargando datos en Elasticsearch"
+    ) as barra:
+        lotes = leer_lotes(index_name, file_path, chunk_size, max_chunk_bytes, offset_inicial, hashes_indexados, delta, origen)
+        for acciones, offset, rechazos in lotes:
+            resumen["documentos"] += len(acciones)
+            pendientes.append((pool.submit(enviar_lote, es, acciones, max_chunk_bytes), offset, rechazos))
+            # Limitar la cantidad de lotes en vuelo para no leer todo el archivo a memoria
+            if len(pendientes) >= 2 * num_hilos:
+                confirmar_lote(pendientes, barra, resumen, dead_letter, checkpoint_path, file_path)
+
+        # Modo incremental: borrar los documentos que ya no están en el archivo
+        if hashes_indexados:
+            ids_eliminados = list(hashes_indexados)
+            delta["eliminados"] = len(ids_eliminados)
+            for inicio in range(0, len(ids_eliminados), chunk_size):
+                acciones = [{"_op_type": "delete", "_index": index_name, "_id": _id} for _id in ids_eliminados[inicio:inicio + chunk_size]]
+                pendientes.append((pool.submit(enviar_lote, es, acciones, max_chunk_bytes), resumen["offset"], []))
+                if len(pendientes) >= 2 * num_hilos:
+                    confirmar_lote(pendientes, barra, resumen, dead_letter, checkpoint_path, file_path)
+
+        while pendientes:
+            confirmar_lote(pendientes, barra, resumen, dead_letter, checkpoint_path, file_path)
+
+    # Carga completa: la próxima ejecución empieza desde el inicio
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    if incremental:
+        print(f"Nuevos: {delta['nuevos']}, modificados: {delta['modificados']}, "
+              f"sin cambios: {delta['sin_cambios']}, eliminados: {delta['eliminados']}")
+    print(f"Documentos indexados correctamente: {resumen['exitos']}")
+    if resumen["fallidos"]:
+        print(f"⚠️ {resumen['fallidos']} documentos fallaron. Revisa {dead_letter_path}")
+    print("Datos cargados correctamente.")
+    return resumen
+
+def obtener_config_actual(es, alias_name):
+    """
+    Devuelve refresh_interval y number_of_replicas del índice que hoy responde a
+    alias_name, para restaurarlos en el índice nuevo. Sin índice previo se usan los
+    valores por defecto (refresh_interval None lo devuelve al default del clúster).
+    """
+    config = {"refresh_interval": None, "number_of_replicas": 1}
+    if es.indices.exists(index=alias_name):
+        for settings in es.indices.get_settings(index=alias_name).values():
+            index_settings = settings["settings"]["index"]
+            config["refresh_interval"] = index_settings.get("refresh_interval")
+            config["number_of_replicas"] = int(index_settings.get("number_of_replicas", 1))
+    return config
+
+def rebuild_index_with_alias(es, alias_name, file_paths, mapping):
+    """
+    Reconstruye el índice sin afectar las consultas que usan alias_name.
+
+    Crea un índice versionado (alias_name_AAAAMMDDHHMMSS) con refresh desactivado y sin
+    réplicas y carga en él todos los archivos de file_paths con bulk_load_parallel.
+    Si algún documento falló o el índice no tiene tantos documentos como se enviaron,
+    el índice nuevo se elimina y el alias no se toca. Si no, lo fusiona (force-merge),
+    restaura la configuración del índice actual y mueve el alias en una sola operación
+    atómica. Los índices anteriores se conservan para poder volver atrás.
+
+    Si alias_name es un índice concreto (como lo crean los otros modos) y no se activó
+    REEMPLAZAR_INDICE_CONCRETO, falla antes de crear el índice nuevo y de cargar nada.
+    """
+    es_indice_concreto = not es.indices.exists_alias(name=alias_name) and es.indices.exists(index=alias_name)
+    if es_indice_concreto and not REEMPLAZAR_INDICE_CONCRETO:
+        raise ValueError(f"{alias_name} es un índice y no un alias. Activa REEMPLAZAR_INDICE_CONCRETO para eliminarlo al mover el alias.")
+    config_final = obtener_config_actual(es, alias_name)
+    nuevo_indice = f"{alias_name}_{time.strftime('%Y%m%d%H%M%S')}"
+
+    cuerpo = dict(mapping)
+    cuerpo["settings"] = {**mapping.get("settings", {}), **CONFIG_CARGA}
+    es.indices.create(index=nuevo_indice, body=cuerpo)
+    print(f"Índice {nuevo_indice} creado para la carga.")
+
+    try:
+        # El checkpoint no aplica: cada reconstrucción carga un índice distinto
+        enviados = fallidos = 0
+        with metricas.etapa("carga") as etapa:
+            for archivo in file_paths:
+                resumen = bulk_load_parallel(es, nuevo_indice, archivo, checkpoint_path=None,
+                                             dead_letter_path=f"{archivo}.rechazados.ndjson")
+                enviados += resumen["documentos"]
+                fallidos += resumen["fallidos"]
+            etapa["filas"] = enviados
+
+        es.indices.refresh(index=nuevo_indice)
+        indexados = es.count(index=nuevo_indice)["count"]
+        if fallidos or indexados != enviados:
+            raise RuntimeError(
+                f"Carga incompleta de {nuevo_indice}: {fallidos} documentos fallaron y el índice tiene "
+                f"{indexados} de {enviados} documentos. El alias {alias_name} no se modifica."
+            )
+
+        # Fusionar antes de activar las réplicas, para no copiarles los segmentos dos veces
+        print("Fusionando segmentos y restaurando configuración...")
+        with metricas.etapa("fusionar_segmentos"):
+            es.options(request_timeout=3600).indices.forcemerge(index=nuevo_indice, max_num_segments=1)
+            es.indices.put_settings(index=nuevo_indice, settings=config_final)
+            es.indices.refresh(index=nuevo_indice)
+
+        # Mover el alias al índice nuevo en una sola operación
+        acciones = [{"add": {"index": nuevo_indice, "alias": alias_name}}]
+        indices_anteriores = []
+        if es.indices.exists_alias(name=alias_name):
+            indices_anteriores = list(es.indices.get_alias(name=alias_name))
+            acciones = [{"remove": {"index": indice, "alias": alias_name}} for indice in indices_anteriores] + acciones
+        elif es.indices.exists(index=alias_name):
+            if not REEMPLAZAR_INDICE_CONCRETO:
+                raise ValueError(f"{alias_name} es un índice y no un alias. Activa REEMPLAZAR_INDICE_CONCRETO para eliminarlo al mover el alias.")
+            acciones.insert(0, {"remove_index": {"index": alias_name}})
+        es.indices.update_aliases(actions=acciones)
+    except BaseException:
+        print(f"Eliminando el índice incompleto {nuevo_indice}...")
+        es.indices.delete(index=nuevo_indice, ignore_unavailable=True)
+        raise
+
+    print(f"Alias {alias_name} apunta ahora a {nuevo_indice}.")
+    if indices_anteriores:
+        print(f"Índices anteriores conservados: {', '.join(indices_anteriores)}")
+
+if __name__ == "__main__":
+    # Tiempos, filas y memoria de la corrida en metricas.jsonl
+    parametros = {"file_path": archivos_indice if MODO_CARGA == "reconstruccion" else file_path, "modo": MODO_CARGA, "perfil_mapeo": PERFIL_MAPEO,
+                  "num_hilos": NUM_HILOS, "chunk_size": CHUNK_SIZE}
+    with metricas.Ejecucion("script_to_upload_data", parametros):
+        # Leer el mapeo del archivo JSON
+        mapping = read_mapping(mapping_path)
 
-# Crear el índice antes de cargar datos
-create_index(es, index_name, mapping)
+        # Ejecutar la función de carga
+        if MODO_CARGA == "reconstruccion":
+            rebuild_index_with_alias(es, index_name, archivos_indice, mapping)
+        else:
+            # Crear el índice antes de cargar datos
+            create_index(es, index_name, mapping)
 
-# Ejecutar la función de carga
-bulk_load_to_elasticsearch(es, index_name, file_path)
+            with metricas.etapa("carga") as etapa:
+                if MODO_CARGA == "paralelo":
+                    etapa["filas"] = bulk_load_parallel(es, index_name, file_path)["exitos"]
+                elif MODO_CARGA == "incremental":
+                    etapa["filas"] = bulk_load_parallel(es, index_name, file_path, incremental=True)["exitos"]
+                else:
+                    bulk_load_to_elasticsearch(es, index_name, file_path)
@@ -0,0 +1,72 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+# script_to_upload_data crea el cliente al importarse con la URL de ElASTIC_API y las
+# credenciales de .env. Uso: ELASTIC_TEST_URL=http://localhost:9200 python -m unittest discover -s tests
+ELASTIC_TEST_URL = os.getenv("ELASTIC_TEST_URL")
+if ELASTIC_TEST_URL:
+    os.environ["ElASTIC_API"] = ELASTIC_TEST_URL
+    from elasticsearch import helpers
+    import script_to_upload_data as carga
+
+MAPEO = os.path.join(os.path.dirname(__file__), "..", "mapping", "calles.json")
+
+@unittest.skipUnless(ELASTIC_TEST_URL, "Define ELASTIC_TEST_URL con la URL de un clúster de pruebas")
+class CargaIncrementalTest(unittest.TestCase):
+    """Carga incremental de dos archivos NDJSON en el mismo índice."""
+
+    def setUp(self):
+        self.es = carga.es
+        self.indice = f"test_carga_incremental_{time.strftime('%Y%m%d%H%M%S')}"
+        self.carpeta = tempfile.TemporaryDirectory()
+        carga.create_index(self.es, self.indice, carga.read_mapping(MAPEO))
+
+    def tearDown(self):
+        self.es.indices.delete(index=self.indice, ignore_unavailable=True)
+        self.carpeta.cleanup()
+
+    def escribir(self, nombre, documentos):
+        ruta = os.path.join(self.carpeta.name, nombre)
+        with open(ruta, "w", encoding="utf-8") as file:
+            for documento in documentos:
+                file.write(json.dumps(documento, ensure_ascii=False) + "\n")
+        return ruta
+
+    def cargar(self, ruta):
+        carga.bulk_load_parallel(self.es, self.indice, ruta, num_hilos=1, incremental=True,
+                                 dead_letter_path=f"{ruta}.rechazados.ndjson")
+        self.es.indices.refresh(index=self.indice)
+
+    def ids(self, origen):
+        return {
+            hit["_id"]
+            for hit in helpers.scan(self.es, index=self.indice, query={"query": {"term": {"origen": origen}}}, _source=False)
+        }
+
+    def test_cargar_un_archivo_no_borra_los_documentos_de_otro(self):
+        calles = self.escribir("calles.ndjson", [
+            {"id_via": i, "name": f"CALLE {i}", "postcode": "150101", "context": "LIMA", "housenumbers": []}
+            for i in range(3)
+        ])
+        manzanas = [
+            {"id_via": None, "name": f"URB {i}", "postcode": "070101", "context": "CALLAO", "housenumbers": []}
+            for i in range(2)
+        ]
+        ruta_manzanas = self.escribir("manzanas.ndjson", manzanas)
+        self.cargar(calles)
+        self.cargar(ruta_manzanas)
+        ids_calles = self.ids("calles.ndjson")
+        self.assertEqual(len(ids_calles), 3)
+        self.assertEqual(len(self.ids("manzanas.ndjson")), 2)
+
+        # Nueva versión de manzanas con un documento menos: solo se borra ese
+        self.escribir("manzanas.ndjson", manzanas[:1])
+        self.cargar(ruta_manzanas)
+        self.assertEqual(self.ids("calles.ndjson"), ids_calles)
+        self.assertEqual(self.ids("manzanas.ndjson"), {carga.generar_id(manzanas[0])})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# script_to_upload_data crea el cliente al importarse (sin conectarse): basta con una URL
+if os.getenv("ELASTIC_TEST_URL"):
+    os.environ["ElASTIC_API"] = os.environ["ELASTIC_TEST_URL"]
+os.environ.setdefault("ElASTIC_API", "http://localhost:9200")
+os.environ.setdefault("ELASTIC_USER", "")
+os.environ.setdefault("ELASTIC_PASSWORD", "")
+import process_streets
+from script_to_upload_data import calcular_hash, generar_id
+
+UBIGEOS = os.path.join(os.path.dirname(__file__), "..", "ubigeo.arrow")
+
+class ConstruccionDeterministaTest(unittest.TestCase):
+    """use_duckdb_unique debe generar los mismos documentos aunque cambie el orden de las filas."""
+
+    def setUp(self):
+        self.carpeta = tempfile.TemporaryDirectory()
+        aleatorio = random.Random(0)
+        # Calles con puertas repetidas en distintas coordenadas y nombres
+        self.filas = [
+            {
+                "id_via": via, "numpuerta": str(numero), "tipo_via": "JR", "nom_via": aleatorio.choice(["GRAU", "PERU"]),
+                "ubigeo": 150101, "lon_x": -77 + aleatorio.random() / 100, "lat_y": -12 + aleatorio.random() / 100,
+            }
+            for via in range(20)
+            for numero in range(1, 60)
+            for _ in range(aleatorio.randint(1, 3))
+        ]
+
+    def tearDown(self):
+        self.carpeta.cleanup()
+
+    def construir(self, nombre, filas, **opciones):
+        """Escribe las filas en parquet, genera el NDJSON y devuelve {_id: (documento, content_hash)}."""
+        entrada = os.path.join(self.carpeta.name, f"{nombre}.parquet")
+        salida = os.path.join(self.carpeta.name, f"{nombre}.ndjson")
+        pq.write_table(pa.Table.from_pylist(filas), entrada)
+        process_streets.use_duckdb_unique(entrada, UBIGEOS, salida, None, **opciones)
+        with open(salida, "r", encoding="utf-8") as file:
+            documentos = [json.loads(line) for line in file]
+        return {generar_id(documento): (documento, calcular_hash(documento)) for documento in documentos}
+
+    def comparar(self, **opciones):
+        mezcladas = list(self.filas)
+        random.Random(1).shuffle(mezcladas)
+        primera = self.construir("primera", self.filas, **opciones)
+        segunda = self.construir("segunda", mezcladas, **opciones)
+        self.assertEqual(primera.keys(), segunda.keys())
+        for _id, (documento, content_hash) in primera.items():
+            self.assertEqual(documento, segunda[_id][0])
+            self.assertEqual(content_hash, segunda[_id][1])
+
+    def test_misma_entrada_mismos_documentos(self):
+        self.comparar()
+
+    def test_calles_divididas_mismas_partes(self):
+        self.comparar(max_casas=7)
+        self.comparar(max_casas=7, ordenar_por_numero=True)
+
+    def test_hash_no_depende_del_orden_de_housenumbers(self):
+        documento = next(iter(self.construir("hash", self.filas).values()))[0]
+        invertido = {**documento, "housenumbers": documento["housenumbers"][::-1]}
+        self.assertEqual(calcular_hash(documento), calcular_hash(invertido))
+
+if __name__ == "__main__":
+    unittest.main()
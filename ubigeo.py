@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+# Tabla de ubigeos en Arrow IPC: postcode ordenado y nombres con codificación de diccionario
+ubigeo_file = "ubigeo.arrow"
+
+# Columnas de la tabla además de postcode
+COLUMNAS = ["cod_departament", "cod_province", "cod_district", "context"]
+
+# Tablas ya cargadas, por ruta (se cargan una sola vez y bajo demanda)
+_tablas = {}
+
+def construir_tabla(df, ubigeo_path=ubigeo_file):
+    """
+    Guarda la tabla de ubigeos en Arrow IPC, ordenada por postcode.
+
+    Args:
+        df (pd.DataFrame): Columnas postcode y COLUMNAS; postcode como número o texto ("010101").
+        ubigeo_path (str): Ruta del archivo .arrow.
+    """
+    df = df.assign(postcode=normalizar_postcode(df["postcode"])).sort_values("postcode")
+    if (df["postcode"] < 0).any() or df["postcode"].duplicated().any():
+        raise ValueError("La tabla de ubigeos tiene postcodes inválidos o repetidos")
+
+    tabla = pa.table({
+        "postcode": pa.array(df["postcode"], pa.int32()),
+        **{columna: pa.array(df[columna], pa.string()).dictionary_encode() for columna in COLUMNAS},
+    })
+    with pa.OSFile(ubigeo_path, "wb") as sink, ipc.new_file(sink, tabla.schema) as writer:
+        writer.write_table(tabla)
+    _tablas.pop(ubigeo_path, None)
+    print(f"Tabla de ubigeos guardada en {ubigeo_path} ({tabla.num_rows} distritos)")
+
+def cargar_tabla(ubigeo_path=ubigeo_file):
+    """Devuelve la tabla de ubigeos como pa.Table, mapeando el archivo en memoria la primera vez."""
+    if ubigeo_path not in _tablas:
+        with pa.memory_map(ubigeo_path) as source:
+            _tablas[ubigeo_path] = ipc.open_file(source).read_all()
+    return _tablas[ubigeo_path]
+
+def normalizar_postcode(postcodes):
+    """
+    Convierte postcodes de cualquier tipo (int, float, texto con ceros a la izquierda)
+    a un arreglo int64; los valores que no son un código entero quedan en -1.
+    """
+    serie = pd.Series(postcodes, copy=False)
+    if serie.dtype == object or pd.api.types.is_string_dtype(serie):
+        serie = serie.astype(str).str.strip()
+    numeros = pd.to_numeric(serie, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    validos = np.isfinite(numeros) & (numeros == np.round(numeros))
+    return np.where(validos, numeros, -1).astype(np.int64)
+
+def buscar(postcodes, columnas=COLUMNAS, ubigeo_path=ubigeo_file):
+    """
+    Busca en bloque los nombres de ubigeo de un arreglo de postcodes.
+
+    Args:
+        postcodes (array-like): Postcodes en cualquier tipo aceptado por normalizar_postcode.
+        columnas (list): Columnas de la tabla a devolver.
+        ubigeo_path (str): Ruta del archivo .arrow.
+
+    Returns:
+        dict: columna -> np.ndarray (object) alineado con postcodes; None si el postcode no existe.
+    """
+    tabla = cargar_tabla(ubigeo_path)
+    claves = tabla["postcode"].to_numpy()
+    buscados = normalizar_postcode(postcodes)
+
+    # Búsqueda binaria sobre los postcodes ordenados
+    posiciones = np.minimum(np.searchsorted(claves, buscados), len(claves) - 1)
+    encontrados = claves[posiciones] == buscados
+
+    resultado = {}
+    for columna in columnas:
+        valores = tabla[columna].combine_chunks()
+        nombres = np.array(valores.dictionary.to_pylist(), dtype=object)
+        indices = valores.indices.to_numpy(zero_copy_only=False)
+        resultado[columna] = np.full(len(buscados), None, dtype=object)
+        resultado[columna][encontrados] = nombres[indices[posiciones[encontrados]]]
+    return resultado
+
+def registrar_en_duckdb(conn, nombre="ubigeo", ubigeo_path=ubigeo_file):
+    """Registra la tabla de ubigeos en una conexión DuckDB para usarla en joins."""
+    conn.register(nombre, cargar_tabla(ubigeo_path))
@@ -1,5 +1,8 @@
-from elasticsearch import Elasticsearch
+from elasticsearch import Elasticsearch, TransportError, helpers
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from tqdm import tqdm  # Barra de progreso
+import pandas as pd
 import os
 
 load_dotenv()
@@ -9,8 +12,176 @@ es = Elasticsearch(
     os.getenv('ElASTIC_API'),
     basic_auth=(os.getenv('ELASTIC_USER'), os.getenv('ELASTIC_PASSWORD'))  # Sustituye "usuario" y "contraseña" por las credenciales correctas
 )
-doc_id = "rw8SJZUBKZn991UEoPk1"  # ID del documento
 index_name = "calles_numero_de_puerta"
+corrections_file = "correcciones/correcciones.csv"  # Archivo de correcciones (.csv o .parquet)
+report_file = "correcciones/reporte_correcciones.csv"  # Resultado por fila
 
-es.update(index=index_name, id=doc_id, body={"doc": {"name": "EDUARDO GIRALDO"}})
-print("registro actualizado")
\ No newline at end of file
+NUM_HILOS = 4  # Peticiones simultáneas
+CHUNK_SIZE = 500  # Actualizaciones por petición bulk
+
+# Columnas del archivo de correcciones:
+# - "doc_id": actualiza el documento por su _id (bulk update).
+# - "id_via" + "postcode": actualiza todos los documentos de esa calle (update_by_query).
+# - "number" + "new_number": renombra ese número de puerta dentro de housenumbers.
+# - Cualquier otra columna (p. ej. "name") se escribe tal cual en el documento.
+COLUMNAS_CLAVE = ["doc_id", "id_via", "postcode", "number", "new_number"]
+
+# Script painless que aplica los campos y el renombrado de número de puerta
+SCRIPT_CORRECCION = """
+for (campo in params.campos.entrySet()) {
+    ctx._source[campo.getKey()] = campo.getValue();
+}
+if (params.number != null && ctx._source.housenumbers != null) {
+    for (casa in ctx._source.housenumbers) {
+        if (casa.number == params.number) {
+            casa.number = params.new_number;
+        }
+    }
+}
+"""
+
+def leer_correcciones(file_path):
+    """Lee el archivo de correcciones en CSV o Parquet."""
+    if file_path.endswith(".parquet"):
+        return pd.read_parquet(file_path)
+    elif file_path.endswith(".csv"):
+        return pd.read_csv(file_path, dtype={"doc_id": str, "number": str, "new_number": str})
+    raise ValueError("Formato de archivo no soportado. Debe ser .csv o .parquet")
+
+def preparar_correccion(fila):
+    """
+    Convierte una fila en el cuerpo de la actualización: un "doc" parcial si solo
+    cambian campos, o un script si además hay que renombrar un número de puerta.
+    Lanza ValueError si la fila trae solo uno de "number" y "new_number".
+    """
+    campos = {
+        columna: valor.item() if hasattr(valor, "item") else valor
+        for columna, valor in fila.items()
+        if columna not in COLUMNAS_CLAVE and pd.notna(valor)
+    }
+    number = fila.get("number")
+    new_number = fila.get("new_number")
+    falta_number = number is None or pd.isna(number)
+    falta_new_number = new_number is None or pd.isna(new_number)
+    if falta_number and falta_new_number:
+        return {"doc": campos}
+    if falta_number or falta_new_number:
+        raise ValueError("Las columnas 'number' y 'new_number' deben venir juntas y con valor")
+    return {
+        "script": {
+            "source": SCRIPT_CORRECCION,
+            "lang": "painless",
+            "params": {"campos": campos, "number": str(number), "new_number": str(new_number)},
+        }
+    }
+
+def actualizar_lote(es, acciones):
+    """
+    Envía un lote de acciones bulk "update" y devuelve (estado, detalle) por acción.
+    Un error de conexión o timeout no corta la corrección: las filas del lote que no
+    llegaron a confirmarse quedan como error.
+    """
+    resultados = []
+    try:
+        for ok, info in helpers.streaming_bulk(
+            es, acciones, chunk_size=len(acciones), raise_on_error=False, raise_on_exception=False
+        ):
+            detalle = info["update"]
+            if ok:
+                resultados.append(("ok", detalle.get("result")))
+            else:
+                resultados.append(("error", str(detalle.get("error"))))
+    except TransportError as e:
+        resultados.extend(("error", f"Error de conexión: {e}") for _ in acciones[len(resultados):])
+    return resultados
+
+def actualizar_por_id(es, index_name, correcciones, num_hilos=NUM_HILOS, chunk_size=CHUNK_SIZE):
+    """
+    Aplica las correcciones por _id con acciones bulk "update", un lote por petición y
+    varios lotes en paralelo. Devuelve una lista (estado, detalle) alineada con las
+    filas de correcciones; las filas inválidas quedan como error sin enviarse.
+    """
+    acciones = []
+    errores = {}  # posición de la fila -> (estado, detalle)
+    for posicion, (_, fila) in enumerate(correcciones.iterrows()):
+        try:
+            acciones.append({"_op_type": "update", "_index": index_name, "_id": fila["doc_id"], **preparar_correccion(fila)})
+        except ValueError as e:
+            errores[posicion] = ("error", str(e))
+    lotes = [acciones[inicio:inicio + chunk_size] for inicio in range(0, len(acciones), chunk_size)]
+    resultados = []
+    # pool.map devuelve los lotes en el mismo orden que las acciones
+    with ThreadPoolExecutor(max_workers=num_hilos) as pool, tqdm(total=len(acciones), desc="Actualizando documentos") as barra:
+        for resultados_lote in pool.map(lambda lote: actualizar_lote(es, lote), lotes):
+            resultados.extend(resultados_lote)
+            barra.update(len(resultados_lote))
+    enviados = iter(resultados)
+    return [errores[posicion] if posicion in errores else next(enviados) for posicion in range(len(correcciones))]
+
+def actualizar_fila_por_clave(es, index_name, fila):
+    """Aplica una corrección a los documentos de una calle (id_via + postcode) con update_by_query."""
+    try:
+        correccion = preparar_correccion(fila)
+    except ValueError as e:
+        return "error", str(e)
+    if "doc" in correccion:
+        correccion = {"script": {"source": SCRIPT_CORRECCION, "lang": "painless", "params": {"campos": correccion["doc"], "number": None}}}
+    try:
+        respuesta = es.update_by_query(
+            index=index_name,
+            query={"bool": {"filter": [
+                {"term": {"id_via": int(fila["id_via"])}},
+                {"term": {"postcode": int(fila["postcode"])}},
+            ]}},
+            script=correccion["script"],
+            conflicts="proceed",
+        )
+    except Exception as e:
+        return "error", str(e)
+    # Con conflicts="proceed" los documentos con conflicto de versión se omiten sin error:
+    # la fila queda parcial si se actualizó algo y como error si no
+    actualizados = respuesta.get("updated", 0)
+    conflictos = respuesta.get("version_conflicts", 0)
+    fallos = respuesta.get("failures") or []
+    detalle = f"{actualizados} documentos actualizados"
+    if conflictos or fallos:
+        detalle += f", {conflictos} conflictos de versión, {len(fallos)} fallos"
+        if fallos:
+            detalle += f": {fallos}"
+        return ("parcial" if actualizados else "error"), detalle
+    if not actualizados:
+        return "sin_coincidencias", detalle
+    return "ok", detalle
+
+def actualizar_por_clave(es, index_name, correcciones, num_hilos=NUM_HILOS):
+    """
+    Aplica las correcciones por id_via + postcode, una update_by_query por fila en paralelo.
+    Devuelve una lista (estado, detalle) alineada con las filas de correcciones.
+    """
+    filas = [fila for _, fila in correcciones.iterrows()]
+    with ThreadPoolExecutor(max_workers=num_hilos) as pool:
+        return list(tqdm(
+            pool.map(lambda fila: actualizar_fila_por_clave(es, index_name, fila), filas),
+            total=len(filas), desc="Actualizando calles"
+        ))
+
+def aplicar_correcciones(es, index_name, corrections_file, report_file):
+    """Lee las correcciones, las aplica según sus columnas clave y guarda el reporte por fila."""
+    correcciones = leer_correcciones(corrections_file)
+
+    if "doc_id" in correcciones.columns:
+        resultados = actualizar_por_id(es, index_name, correcciones)
+    elif "id_via" in correcciones.columns and "postcode" in correcciones.columns:
+        resultados = actualizar_por_clave(es, index_name, correcciones)
+    else:
+        raise ValueError("El archivo de correcciones debe tener la columna 'doc_id' o las columnas 'id_via' y 'postcode'")
+
+    reporte = correcciones.copy()
+    reporte["estado"] = [estado for estado, _ in resultados]
+    reporte["detalle"] = [detalle for _, detalle in resultados]
+    reporte.to_csv(report_file, index=False)
+
+    print(reporte["estado"].value_counts().to_string())
+    print(f"Reporte guardado en {report_file}")
+
+aplicar_correcciones(es, index_name, corrections_file, report_file)